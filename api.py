@@ -0,0 +1,229 @@
+import hashlib
+import json
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, current_app, request
+from sqlalchemy import tuple_
+from model import db, Venue, Artist, Show, DEFAULT_SHOW_DURATION, MAX_SHOW_DURATION
+from pagination import encode_cursor, decode_cursor
+from queries import VenueRow, ArtistRow, live
+from scheduling import BatchError, availability, batch_start_times, book_shows
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+# columns: field -> column expression; sort: keyset fields; joins: field -> (model, onclause) it needs.
+Resource = namedtuple('Resource', ['model', 'columns', 'sort', 'parsers', 'joins'])
+
+RESOURCES = {
+    'venues': Resource(Venue, OrderedDict((field, getattr(Venue, field)) for field in VenueRow._fields),
+                       ('id',), (int,), {}),
+    'artists': Resource(Artist, OrderedDict((field, getattr(Artist, field)) for field in ArtistRow._fields),
+                        ('id',), (int,), {}),
+    'shows': Resource(Show, OrderedDict([
+        ('id', Show.id),
+        ('start_time', Show.start_time),
+        ('venue_id', Show.venue_id),
+        ('venue_name', Venue.name.label('venue_name')),
+        ('artist_id', Show.artist_id),
+        ('artist_name', Artist.name.label('artist_name')),
+        ('artist_image_link', Artist.image_link.label('artist_image_link')),
+    ]), ('start_time', 'id'), (datetime.fromisoformat, int), {
+        'venue_name': (Venue, Show.venue_id == Venue.id),
+        'artist_name': (Artist, Show.artist_id == Artist.id),
+        'artist_image_link': (Artist, Show.artist_id == Artist.id),
+    }),
+}
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, status=400):
+        super(ApiError, self).__init__(message)
+        self.status = status
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':'),
+                      default=lambda value: value.isoformat() if isinstance(value, datetime) else str(value)
+                      ).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    response = Response(dumps(payload), status=status, mimetype='application/json')
+    if status == 200:
+        # Clients revalidate with If-None-Match and get an empty 304 when the payload is unchanged.
+        response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+        response.headers['Cache-Control'] = 'no-cache'
+        response.make_conditional(request)
+    return response
+
+
+@api.errorhandler(ApiError)
+def api_error(error):
+    return json_response({
+        'success': False,
+        'error': str(error)
+    }, error.status)
+
+
+def requested_fields(resource):
+    fields = request.args.get('fields')
+    if not fields:
+        return list(resource.columns)
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in resource.columns]
+    if unknown:
+        raise ApiError('Unknown fields: {0}'.format(', '.join(unknown)))
+    return fields
+
+
+def projection(resource, fields):
+    selected = fields + [field for field in resource.sort if field not in fields]
+    query = resource.model.query.with_entities(*[resource.columns[field] for field in selected]) \
+        .filter(live(resource.model))
+    joined = set()
+    for field in selected:
+        if field in resource.joins and resource.joins[field][0] not in joined:
+            model, onclause = resource.joins[field]
+            query = query.join(model, onclause)
+            joined.add(model)
+    return selected, query
+
+
+def page_size():
+    try:
+        limit = int(request.args.get('limit', current_app.config['API_PAGE_SIZE']))
+    except ValueError:
+        raise ApiError('limit must be an integer')
+    return max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+
+@api.route('/<any(venues, artists, shows):name>')
+def list_resource(name):
+    resource = RESOURCES[name]
+    fields = requested_fields(resource)
+    selected, query = projection(resource, fields)
+    try:
+        after = decode_cursor(request.args.get('cursor'), *resource.parsers)
+    except ValueError as err:
+        raise ApiError(str(err))
+
+    sort_columns = [resource.columns[field] for field in resource.sort]
+    if after:
+        query = query.filter(tuple_(*sort_columns) > after)
+    limit = page_size()
+    rows = query.order_by(*sort_columns).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = dict(zip(selected, rows[-1]))
+        next_cursor = encode_cursor(*[last[field] for field in resource.sort])
+
+    return json_response({
+        'data': [{field: value for field, value in zip(selected, row) if field in fields} for row in rows],
+        'next_cursor': next_cursor,
+    })
+
+
+@api.route('/<any(venues, artists, shows):name>/<int:item_id>')
+def get_resource(name, item_id):
+    resource = RESOURCES[name]
+    fields = requested_fields(resource)
+    selected, query = projection(resource, fields)
+    row = query.filter(resource.model.id == item_id).first()
+    if row is None:
+        raise ApiError('{0} #{1} not found'.format(resource.model.__name__, item_id), 404)
+    return json_response({
+        'data': {field: value for field, value in zip(selected, row) if field in fields},
+    })
+
+
+def requested_ids():
+    try:
+        ids = sorted(set(int(value) for value in request.args.get('ids', '').split(',') if value.strip()))
+    except ValueError:
+        raise ApiError('ids must be a comma separated list of integers')
+    if not ids:
+        raise ApiError('ids is required')
+    if len(ids) > current_app.config['AVAILABILITY_MAX_IDS']:
+        raise ApiError('At most {0} ids per request'.format(current_app.config['AVAILABILITY_MAX_IDS']))
+    return ids
+
+
+def requested_window():
+    try:
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else \
+            datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else start + timedelta(days=30)
+        min_free = timedelta(minutes=int(request.args.get('min_free', 0)))
+    except ValueError as err:
+        raise ApiError(str(err))
+    if start.tzinfo is not None or end.tzinfo is not None:
+        # Show times are stored without a time zone; an offset can't be compared with them.
+        raise ApiError('from and to must be local times without a UTC offset')
+    if end <= start:
+        raise ApiError('to must be after from')
+    if end - start > timedelta(days=current_app.config['AVAILABILITY_MAX_DAYS']):
+        raise ApiError('The window can span at most {0} days'.format(current_app.config['AVAILABILITY_MAX_DAYS']))
+    return start, end, min_free
+
+
+@api.route('/<any(venues, artists):name>/availability')
+def resource_availability(name):
+    column = Show.venue_id if name == 'venues' else Show.artist_id
+    ids = requested_ids()
+    start, end, min_free = requested_window()
+    return json_response({
+        'from': start,
+        'to': end,
+        'data': availability(column, ids, start, end, min_free),
+    })
+
+
+def batch_request():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        raise ApiError('Expected a JSON object')
+    try:
+        venue_id, artist_id = int(payload['venue_id']), int(payload['artist_id'])
+        start_time = datetime.fromisoformat(payload['start_time']) if payload.get('start_time') else None
+        duration = timedelta(minutes=int(payload['duration'])) if payload.get('duration') else None
+    except KeyError as err:
+        raise ApiError('{0} is required'.format(err.args[0]))
+    except (TypeError, ValueError) as err:
+        raise ApiError(str(err))
+    dates = payload.get('dates') or []
+    if not isinstance(dates, list):
+        raise ApiError('dates must be a list')
+    if not isinstance(payload.get('rrule') or '', str):
+        raise ApiError('rrule must be a string')
+    return venue_id, artist_id, dates, (payload.get('rrule') or '').strip(), start_time, duration, \
+        bool(payload.get('allow_partial'))
+
+
+@api.route('/shows/batch', methods=['POST'])
+def book_show_batch():
+    """{"venue_id", "artist_id", "dates": [...] or "rrule" + "start_time", "duration" (minutes), "allow_partial"}"""
+    venue_id, artist_id, dates, rule, start_time, duration, allow_partial = batch_request()
+    if duration is not None and not timedelta(0) < duration <= MAX_SHOW_DURATION:
+        raise ApiError('duration must be between 1 and 1440 minutes')
+    try:
+        starts = batch_start_times(dates, rule, start_time, current_app.config['BATCH_SHOWS_MAX'])
+        result = book_shows(venue_id, artist_id, starts, duration or DEFAULT_SHOW_DURATION, allow_partial)
+    except BatchError as err:
+        return json_response({'success': False, 'error': str(err), 'errors': err.errors}, err.status)
+    finally:
+        db.session.close()
+    return json_response({
+        'success': bool(result.created),
+        'created': result.created,
+        'failures': result.failures,
+    }, 201 if result.created else 409)
@@ -1,38 +1,93 @@
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from flask import Blueprint, Flask, current_app, render_template, request, Response, flash, redirect, url_for, \
+    send_from_directory, stream_with_context
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import cast, String, func, distinct, ARRAY, Table
-from sqlalchemy.dialects import postgresql
+from sqlalchemy import and_, cast, String, distinct, ARRAY, Table
+from sqlalchemy.exc import IntegrityError
 import logging
 from logging import Formatter, FileHandler
 from flask_wtf import Form
 from flask_migrate import Migrate
 from forms import *
-from model import Venue, Artist, Show
+from model import db, Venue, Artist, Show, Job, DEFAULT_SHOW_DURATION
+from pagination import encode_cursor, decode_cursor
+from queries import ShowRow, Filters, NO_FILTERS, VenueEditRow, ArtistEditRow, columns, live, fetch_all, venue_areas, \
+    artist_names, venue_edit_row, artist_edit_row, venue_detail, artist_detail, shows_listing, \
+    search_by_name, upcoming_and_past_shows, facet_counts, venue_names
+from commands import register_commands
+from cache import cache
+from export import FORMATS, export_chunks
+from api import api
+from formatting import format_datetime
+from db_pool import InstrumentedQueuePool, pool_stats
+from instrumentation import sql_instrumentation
+from scheduling import BatchError, booking_errors, batch_start_times, book_shows, missing_entities
+from typeahead import typeahead
+from templating import init_templates, precompile_templates, fragment_cache
+from assets import assets
+from replicas import replica_router
+from purge import purge_deleted
+from jobs import jobs, job_dict
+from bulk_import import import_file, reject_writer
+
+moment = Moment()
+migrate = Migrate()
+main = Blueprint('main', __name__)
+
+
+def create_app(config_object='config'):
+    app = Flask(__name__)
+    app.config.from_object(config_object)
+    # Engine options come from config; the pool class only adds checkout wait metrics on top of QueuePool.
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'].setdefault('poolclass', InstrumentedQueuePool)
+
+    db.init_app(app)
+    migrate.init_app(app, db)
+    replica_router.init_app(app, db)
+    moment.init_app(app)
+    cache.init_app(app)
+    sql_instrumentation.init_app(app)
+    typeahead.init_app(app, {'venues': venue_names, 'artists': artist_names})
+    init_templates(app)
+    assets.init_app(app)
+    jobs.init_app(app)
+    app.register_blueprint(main)
+    app.register_blueprint(api)
+    register_commands(app, db)
+    if app.config['TEMPLATE_PRECOMPILE']:
+        # After the blueprints: templates can only be compiled once their filters are registered.
+        precompile_templates(app)
+
+    if not app.debug:
+        file_handler = FileHandler('error.log')
+        file_handler.setFormatter(
+            Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+        )
+        app.logger.setLevel(logging.INFO)
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
+        app.logger.info('errors')
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+    return app
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "MM, d, y 'at' h:m"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+main.add_app_template_filter(format_datetime, 'datetime')
 
 
-app.jinja_env.filters['datetime'] = format_datetime
+def stream_template(template_name, **context):
+    current_app.update_template_context(context)
+    stream = current_app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(current_app.config['TEMPLATE_STREAM_BUFFER'])
+    return stream
 
 
-@app.route('/')
+@main.route('/')
 def index():
     return render_template('pages/home.html')
 
@@ -42,34 +97,70 @@ VENUES
 '''
 
 
-@app.route('/venues')
+VENUE_AREAS_CACHE_KEY = 'venues:areas'
+VENUE_FACETS_NAMESPACE = 'facets:venues'
+ARTIST_FACETS_NAMESPACE = 'facets:artists'
+
+
+def venues_changed():
+    cache.delete(VENUE_AREAS_CACHE_KEY)
+    cache.invalidate_namespace(VENUE_FACETS_NAMESPACE)
+
+
+def artists_changed():
+    cache.invalidate_namespace(ARTIST_FACETS_NAMESPACE)
+
+
+def requested_filters():
+    # ?genre=Jazz&genre=Blues&city=New York&state=NY, from the query string or a submitted form.
+    return Filters(genres=tuple(sorted(set(genre for genre in request.values.getlist('genre') if genre))),
+                   city=request.values.get('city') or None,
+                   state=request.values.get('state') or None)
+
+
+def facets_response(model, namespace):
+    filters = requested_filters()
+    key = '{0}:{1}:{2}'.format(namespace, cache.namespace(namespace), json.dumps(filters))
+    facets = cache.get_or_set(key, lambda: facet_counts(model, filters), current_app.config['FACETS_CACHE_TTL'],
+                              label=namespace)
+    return Response(json.dumps(dict(facets, filters=filters._asdict())), mimetype='application/json')
+
+
+@main.route('/venues')
 def venues():
-    data = Venue.query.with_entities(Venue.city, Venue.state,
-                                     postgresql.array_agg(
-                                         func.json_build_object('id', Venue.id, 'name', Venue.name)).label('venues')) \
-        .group_by(Venue.city, Venue.state).all()
-    return render_template('pages/venues.html', areas=data)
+    filters = requested_filters()
+    if filters != NO_FILTERS:
+        return render_template('pages/venues.html', areas=venue_areas(filters))
+    areas = cache.get_or_set(VENUE_AREAS_CACHE_KEY, venue_areas, current_app.config['VENUE_AREAS_CACHE_TTL'])
+    return render_template('pages/venues.html', areas=areas)
 
 
-@app.route('/venues/search', methods=['POST'])
-def search_venues():
+@main.route('/venues/facets')
+def venue_facets():
+    return facets_response(Venue, VENUE_FACETS_NAMESPACE)
+
+
+def requested_search_term():
     data = dict(request.form or request.json or request.data)
-    search_term = data.get('search_term')
+    return data.get('search_term')
+
+
+def render_search(template_name, results, search_term):
+    response = {
+        "count": results[0].total if results else 0,
+        "data": results
+    }
+
+    return render_template(template_name, results=response, search_term=search_term)
+
+
+@main.route('/venues/search', methods=['POST'])
+def search_venues():
+    search_term = requested_search_term()
     if search_term:
-        venue_results = Venue.query.filter(Venue.name.ilike(
-            f'%{search_term}%')
-        ).all()
-
-        response = {
-            "count": len(venue_results),
-            "data": [{
-                "id": venue.id,
-                "name": venue.name
-            } for venue in venue_results]
-        }
-
-        return render_template('pages/search_venues.html', results=response,
-                               search_term=search_term)
+        venue_results = search_by_name(Venue, search_term, current_app.config['SEARCH_RESULT_LIMIT'],
+                                       requested_filters())
+        return render_search('pages/search_venues.html', venue_results, search_term)
     else:
         return json.dumps({
             'success': False,
@@ -77,61 +168,58 @@ def search_venues():
         }), 400
 
 
-@app.route('/venues/<int:venue_id>')
+def autocomplete_response(kind):
+    # Answered from this process's in-memory index; never touches the database.
+    limit = max(1, min(request.args.get('limit', current_app.config['TYPEAHEAD_LIMIT'], type=int),
+                       current_app.config['TYPEAHEAD_LIMIT'] * 5))
+    matches = typeahead.search(kind, request.args.get('q', ''), limit)
+    return Response(json.dumps({'data': [{'id': entity_id, 'name': name} for entity_id, name in matches]}),
+                    mimetype='application/json')
+
+
+@main.route('/venues/autocomplete')
+def venue_autocomplete():
+    return autocomplete_response('venues')
+
+
+@main.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
-    venue = Venue.query.filter_by(id=venue_id).one_or_none()
+    now = datetime.now()
+    venue = venue_detail(venue_id, now)
     if not venue:
         return json.dumps({
             'success':
                 False,
             'error':
-                'Venue #' + venue_id + ' not found'
+                'Venue #{0} not found'.format(venue_id)
         }), 404
-    past_shows = []
-    upcoming_shows = []
-    available_shows = Show.query.filter_by(venue_id=venue_id).join(Artist, Show.artist_id == Artist.id).all()
-    for show in available_shows:
-        venue_show = {"artist_id": show.artist_id,
-                      "artist_name": show.artist.name,
-                      "artist_image_link": show.artist.image_link,
-                      "start_time": str(show.start_time)
-                      }
-
-        current_date = datetime.now()
-
-        if current_date < show.start_time:
-            upcoming_shows.append(venue_show)
-        else:
-            past_shows.append(venue_show)
-
-    data = {
-        'id': venue.id,
-        'name': venue.name,
-        'genres': venue.genres,
-        'address': venue.address,
-        'city': venue.city,
-        'state': venue.state,
-        'phone': venue.phone,
-        'image_link': venue.image_link,
-        'facebook_link': venue.facebook_link,
-        'seeking_talent': venue.seeking_talent,
-        'seeking_description': venue.seeking_description,
-        'website': venue.website,
-        'past_shows': past_shows,
-        'upcoming_shows': upcoming_shows,
-        'past_shows_count': len(past_shows),
-        'upcoming_shows_count': len(upcoming_shows),
-    }
+    upcoming, past = upcoming_and_past_shows(Show.venue_id, venue_id, Artist, Show.artist_id, now,
+                                             current_app.config['DETAIL_SHOWS_LIMIT'])
+    return render_venue(venue, upcoming, past)
+
+
+def render_venue(venue, upcoming, past):
+    data = dict(venue._asdict(),
+                past_shows=[venue_show(show) for show in past],
+                upcoming_shows=[venue_show(show) for show in upcoming])
 
     return render_template('pages/show_venue.html', venue=data)
 
 
-@app.route('/venues/create', methods=['GET'])
+def venue_show(show):
+    return {"artist_id": show.artist_id,
+            "artist_name": show.name,
+            "artist_image_link": show.image_link,
+            "start_time": show.start_time
+            }
+
+
+@main.route('/venues/create', methods=['GET'])
 def create_venue_form():
     return render_template('forms/new_venue.html', form=VenueForm())
 
 
-@app.route('/venues/create', methods=['POST'])
+@main.route('/venues/create', methods=['POST'])
 def create_venue_submission():
     try:
         form = VenueForm(request.form)
@@ -148,6 +236,8 @@ def create_venue_submission():
 
         db.session.add(venue)
         db.session.commit()
+        venues_changed()
+        typeahead.add('venues', venue.id, venue.name)
         flash('Venue: {0} created successfully'.format(venue.name))
     except Exception as err:
         flash('An error occurred creating the Venue: {0}. Error: {1}'.format(venue.name, err))
@@ -158,89 +248,103 @@ def create_venue_submission():
     return render_template('pages/home.html'), 201
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@main.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-    existing_venue = Venue.query.filter_by(id=venue_id).one_or_none()
-    if not existing_venue:
+    # Soft delete: one UPDATE hides the venue and its shows; the purger removes the rows in batches later.
+    deleted = Venue.query.filter(Venue.id == venue_id, Venue.deleted_at.is_(None)) \
+        .update({'deleted_at': datetime.now()}, synchronize_session=False)
+    db.session.commit()
+    if not deleted:
         return json.dumps({
             'success':
                 False,
             'error':
-                'Venue #' + venue_id + ' not found'
+                'Venue #{0} not found'.format(venue_id)
         }), 404
-    else:
-        try:
-            Venue.query.filter_by(id=venue_id).delete()
-            db.session.commit()
-            flash('Venue: {0} deleted successfully'.format(venue_id))
-        except Exception as err:
-            db.session.rollback()
-            flash('An error occurred deleting the Venue: {0}. Error: {1}'.format(venue_id, err))
-        finally:
-            db.session.close()
-
-        return venue_id
+    venues_changed()
+    typeahead.remove('venues', venue_id)
+    jobs.enqueue('purge-deleted', unique=True)
+    flash('Venue: {0} deleted successfully'.format(venue_id))
+    return str(venue_id)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue_form(venue_id):
-    existing_venue = Venue.query.filter_by(id=venue_id).one_or_none()
-    if not existing_venue:
+    venue = venue_edit_row(venue_id)
+    if not venue:
         return json.dumps({
             'success':
                 False,
             'error':
-                'Venue #' + venue_id + ' not found'
+                'Venue #{0} not found'.format(venue_id)
         }), 404
     else:
-        venue = {
-            "id": existing_venue.id,
-            "name": existing_venue.name,
-            "genres": existing_venue.genres,
-            "address": existing_venue.address,
-            "city": existing_venue.city,
-            "state": existing_venue.state,
-            "phone": existing_venue.phone,
-            "website": existing_venue.website,
-            "facebook_link": existing_venue.facebook_link,
-            "seeking_talent": existing_venue.seeking_talent,
-            "seeking_description": existing_venue.seeking_description,
-            "image_link": existing_venue.image_link
-        }
-
         return render_template('forms/edit_venue.html', form=VenueForm(), venue=venue)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['PATCH'])
-def edit_venue_submission(venue_id):
-    existing_venue = Venue.query.filter_by(id=venue_id).one_or_none()
-    if not existing_venue:
-        return json.dumps({
+# Columns an edit may change. A field left out or empty keeps the stored value.
+VENUE_EDIT_FIELDS = ('name', 'city', 'state', 'address', 'phone', 'genres', 'facebook_link', 'image_link')
+ARTIST_EDIT_FIELDS = ('name', 'city', 'state', 'phone', 'genres', 'facebook_link', 'image_link')
+
+
+def update_versioned(model, row_type, entity_id, version, values):
+    # One round trip: the edited row comes back from RETURNING, and nothing is written if another edit got in first.
+    row = db.session.execute(model.__table__.update()
+                             .where(and_(model.id == entity_id, model.version == version, live(model)))
+                             .values(dict(values, version=model.version + 1))
+                             .returning(*columns(model, row_type))).first()
+    db.session.commit()
+    return row_type._make(row) if row is not None else None
+
+
+def edit_submission(model, row_type, label, entity_id, form, fields):
+    # Returns the edited row, or None and the error response.
+    values = {name: getattr(form, name).data for name in fields if name in request.form and getattr(form, name).data}
+    invalid = {name: getattr(form, name).errors for name in values if not getattr(form, name).validate(form)}
+    version = request.form.get('version', type=int)
+    if invalid or not values or version is None:
+        return None, (json.dumps({
             'success':
                 False,
             'error':
-                'Venue #' + venue_id + ' not found'
-        }), 404
-    else:
-        form = VenueForm(request.form)
-        existing_venue.name = form.name.data or existing_venue.name
-        existing_venue.city = form.city.data or existing_venue.city
-        existing_venue.state = form.state.data or existing_venue.state
-        existing_venue.phone = form.phone.data or existing_venue.phone
-        existing_venue.genres = form.genres.data or existing_venue.genres,
-        existing_venue.facebook_link = form.facebook_link.data or existing_venue.facebook_link,
-        existing_venue.image_link = form.image_link.data or existing_venue.image_link
-
-        try:
-            db.session.commit()
-            flash('Venue: {0} edted successfully'.format(venue_id))
-        except Exception as err:
-            db.session.rollback()
-            flash('An error occurred editing the Venue: {0}. Error: {1}'.format(venue_id, err))
-        finally:
-            db.session.close()
-
-        return render_template('forms/edit_venue.html', form=VenueForm(), venue=existing_venue)
+                invalid or ('Nothing to update' if not values else 'version is required')
+        }), 400)
+    try:
+        row = update_versioned(model, row_type, entity_id, version, values)
+        # Only when nothing matched: tell a missing row from one that has moved on to another version.
+        current = db.session.query(model.version).filter(model.id == entity_id, live(model)).scalar() \
+            if row is None else None
+    finally:
+        db.session.close()
+    if row is not None:
+        return row, None
+    if current is None:
+        return None, (json.dumps({
+            'success':
+                False,
+            'error':
+                '{0} #{1} not found'.format(label, entity_id)
+        }), 404)
+    return None, (json.dumps({
+        'success':
+            False,
+        'error':
+            '{0} #{1} was changed by someone else; reload it and edit version {2}'.format(label, entity_id, current),
+        'version':
+            current
+    }), 409)
+
+
+@main.route('/venues/<int:venue_id>/edit', methods=['PATCH'])
+def edit_venue_submission(venue_id):
+    form = VenueForm(request.form)
+    venue, failure = edit_submission(Venue, VenueEditRow, 'Venue', venue_id, form, VENUE_EDIT_FIELDS)
+    if failure:
+        return failure
+    venues_changed()
+    typeahead.add('venues', venue_id, venue.name)
+    flash('Venue: {0} edited successfully'.format(venue_id))
+    return render_template('forms/edit_venue.html', form=VenueForm(), venue=venue)
 
 
 '''
@@ -248,32 +352,23 @@ ARTISTS
 '''
 
 
-@app.route('/artists')
+@main.route('/artists')
 def artists():
-    available_artists = Artist.query.all()
-    return render_template('pages/artists.html',
-                           artists=[{'id': artist.id, 'name': artist.name} for artist in available_artists])
+    return render_template('pages/artists.html', artists=artist_names(requested_filters()))
+
+
+@main.route('/artists/facets')
+def artist_facets():
+    return facets_response(Artist, ARTIST_FACETS_NAMESPACE)
 
 
-@app.route('/artists/search', methods=['POST'])
+@main.route('/artists/search', methods=['POST'])
 def search_artists():
-    data = dict(request.form or request.json or request.data)
-    search_term = data.get('search_term')
+    search_term = requested_search_term()
     if search_term:
-        artist_results = Artist.query.filter(Artist.name.ilike(
-            f'%{search_term}%')
-        ).all()
-
-        response = {
-            "count": len(artist_results),
-            "data": [{
-                "id": artist.id,
-                "name": artist.name
-            } for artist in artist_results]
-        }
-
-        return render_template('pages/search_artists.html', results=response,
-                               search_term=search_term)
+        artist_results = search_by_name(Artist, search_term, current_app.config['SEARCH_RESULT_LIMIT'],
+                                        requested_filters())
+        return render_search('pages/search_artists.html', artist_results, search_term)
     else:
         return json.dumps({
             'success': False,
@@ -281,123 +376,97 @@ def search_artists():
         }), 400
 
 
-@app.route('/artists/<int:artist_id>')
+@main.route('/artists/autocomplete')
+def artist_autocomplete():
+    return autocomplete_response('artists')
+
+
+@main.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-    artist = Artist.query.filter_by(id=artist_id).one_or_none()
+    now = datetime.now()
+    artist = artist_detail(artist_id, now)
 
     if not artist:
         return json.dumps({
             'success':
                 False,
             'error':
-                'Artist #' + artist_id + ' not found'
+                'Artist #{0} not found'.format(artist_id)
         }), 404
 
-    past_shows = []
-    upcoming_shows = []
-    available_shows = Show.query.filter_by(artist_id=artist_id).join(Venue, Show.venue_id == Venue.id).all()
-    for show in available_shows:
-        artist_show = {"venue_id": show.venue_id,
-                       "venue_name": show.venue.name,
-                       "venue_image_link": show.venue.image_link,
-                       "start_time": str(show.start_time)
-                       }
-
-        current_date = datetime.now()
-
-        if current_date < show.start_time:
-            upcoming_shows.append(artist_show)
-        else:
-            past_shows.append(artist_show)
-
-    data = {
-        "id": artist.id,
-        "name": artist.name,
-        "genres": artist.genres,
-        "city": artist.city,
-        "state": artist.state,
-        "phone": artist.phone,
-        "seeking_venue": artist.seeking_venue,
-        "image_link": artist.image_link,
-        "facebook_link": artist.facebook_link,
-        "seeking_description": artist.seeking_description,
-        "website": artist.website,
-        "past_shows": past_shows,
-        "upcoming_shows": upcoming_shows,
-        "past_shows_count": len(past_shows),
-        "upcoming_shows_count": len(upcoming_shows),
-    }
+    upcoming, past = upcoming_and_past_shows(Show.artist_id, artist_id, Venue, Show.venue_id, now,
+                                             current_app.config['DETAIL_SHOWS_LIMIT'])
+    return render_artist(artist, upcoming, past)
+
+
+def render_artist(artist, upcoming, past):
+    data = dict(artist._asdict(),
+                past_shows=[artist_show(show) for show in past],
+                upcoming_shows=[artist_show(show) for show in upcoming])
 
     return render_template('pages/show_artist.html', artist=data)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
-def edit_artist(artist_id):
-    existing_artist = Artist.query.filter_by(id=artist_id).one_or_none()
-    if not existing_artist:
+def artist_show(show):
+    return {"venue_id": show.venue_id,
+            "venue_name": show.name,
+            "venue_image_link": show.image_link,
+            "start_time": show.start_time
+            }
+
+
+@main.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+    deleted = Artist.query.filter(Artist.id == artist_id, Artist.deleted_at.is_(None)) \
+        .update({'deleted_at': datetime.now()}, synchronize_session=False)
+    db.session.commit()
+    if not deleted:
         return json.dumps({
             'success':
                 False,
             'error':
-                'Artist #' + artist_id + ' not found'
+                'Artist #{0} not found'.format(artist_id)
         }), 404
-    else:
-        artist = {
-            "id": existing_artist.id,
-            "name": existing_artist.name,
-            "genres": existing_artist.genres,
-            "city": existing_artist.city,
-            "state": existing_artist.state,
-            "phone": existing_artist.phone,
-            "website": existing_artist.website,
-            "facebook_link": existing_artist.facebook_link,
-            "seeking_venue": existing_artist.seeking_venue,
-            "seeking_description": existing_artist.seeking_description,
-            "image_link": existing_artist.image_link
-        }
-
-        return render_template('forms/edit_artist.html', form=ArtistForm(), artist=artist)
+    artists_changed()
+    typeahead.remove('artists', artist_id)
+    jobs.enqueue('purge-deleted', unique=True)
+    flash('Artist: {0} deleted successfully'.format(artist_id))
+    return str(artist_id)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['PATCH'])
-def edit_artist_submission(artist_id):
-    existing_artist = Artist.query.filter_by(id=artist_id).one_or_none()
-    if not existing_artist:
+@main.route('/artists/<int:artist_id>/edit', methods=['GET'])
+def edit_artist(artist_id):
+    artist = artist_edit_row(artist_id)
+    if not artist:
         return json.dumps({
             'success':
                 False,
             'error':
-                'Artist #' + artist_id + ' not found'
+                'Artist #{0} not found'.format(artist_id)
         }), 404
     else:
-        form = ArtistForm(request.form)
+        return render_template('forms/edit_artist.html', form=ArtistForm(), artist=artist)
+
+
+@main.route('/artists/<int:artist_id>/edit', methods=['PATCH'])
+def edit_artist_submission(artist_id):
+    form = ArtistForm(request.form)
+    artist, failure = edit_submission(Artist, ArtistEditRow, 'Artist', artist_id, form, ARTIST_EDIT_FIELDS)
+    if failure:
+        return failure
+    artists_changed()
+    typeahead.add('artists', artist_id, artist.name)
+    flash('Artist: {0} edited successfully'.format(artist_id))
+    return redirect(url_for('main.show_artist', artist_id=artist_id))
+
 
-        existing_artist.name = form.name.data or existing_artist.name
-        existing_artist.city = form.city.data or existing_artist.city
-        existing_artist.state = form.state.data or existing_artist.state
-        existing_artist.phone = form.phone.data or existing_artist.phone
-        existing_artist.genres = form.genres.data or existing_artist.genres
-        existing_artist.facebook_link = form.facebook_link.data or existing_artist.facebook_link
-        existing_artist.image_link = form.image_link.data or existing_artist.image_link
-        try:
-            db.session.commit()
-            flash('Artist: {0} edited successfully'.format(artist_id))
-        except Exception as err:
-            db.session.rollback()
-            flash('An error occurred editing the Artist: {0}. Error: {1}'.format(artist_id, err))
-        finally:
-            db.session.close()
-
-        return redirect('/artist/' + artist_id)
-
-
-@app.route('/artists/create', methods=['GET'])
+@main.route('/artists/create', methods=['GET'])
 def create_artist_form():
     form = ArtistForm()
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     try:
         form = ArtistForm(request.form)
@@ -413,6 +482,8 @@ def create_artist_submission():
 
         db.session.add(artist)
         db.session.commit()
+        artists_changed()
+        typeahead.add('artists', artist.id, artist.name)
         flash('Artist: {0} created successfully'.format(artist.name))
     except Exception as err:
         flash('An error occurred creating the Venue: {0}. Error: {1}'.format(artist.name, err))
@@ -428,42 +499,83 @@ SHOWS
 '''
 
 
-@app.route('/shows')
+def requested_shows_cursor():
+    return decode_cursor(request.args.get('after'), datetime.fromisoformat, int)
+
+
+@main.route('/shows')
 def shows():
-    available_shows = Show.query.join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id).all()
+    try:
+        after = requested_shows_cursor()
+    except ValueError as err:
+        return json.dumps({
+            'success': False,
+            'error': str(err)
+        }), 400
+
+    query = shows_listing(after)
+
+    if request.args.get('stream'):
+        rows = query.execution_options(stream_results=True).yield_per(current_app.config['SHOWS_STREAM_BATCH_SIZE'])
+        return Response(stream_with_context(
+            stream_template('pages/shows.html', shows=(ShowRow._make(show) for show in rows), next_cursor=None)
+        ))
+
+    page_size = current_app.config['SHOWS_PAGE_SIZE']
+    return render_shows(fetch_all(ShowRow, query.limit(page_size + 1)), page_size)
 
-    return render_template('pages/shows.html', shows=[{
-        "venue_id": show.venue_id,
-        "venue_name": show.venue.name,
-        "artist_id": show.artist_id,
-        "artist_name": show.artist.name,
-        "artist_image_link": show.artist.image_link,
-        "start_time": format_datetime(str(show.start_time), format='full')
-    } for show in available_shows])
 
+def render_shows(available_shows, page_size):
+    # available_shows holds up to page_size + 1 rows; the extra row only says that a next page exists.
+    next_cursor = None
+    if len(available_shows) > page_size:
+        available_shows = available_shows[:page_size]
+        next_cursor = encode_cursor(available_shows[-1].start_time, available_shows[-1].id)
 
-@app.route('/shows/create')
+    return render_template('pages/shows.html', shows=available_shows, next_cursor=next_cursor)
+
+
+@main.route('/shows/create')
 def create_shows():
     # renders form. do not touch.
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@main.route('/shows/create', methods=['POST'])
 def create_show_submission():
+    form = ShowForm(request.form)
+    if not all([form.start_time.validate(form), form.end_time.validate(form)]):
+        return render_template('forms/new_show.html', form=form), 400
+    start_time = form.start_time.data
+    end_time = form.end_time.data or start_time + DEFAULT_SHOW_DURATION
+    missing = missing_entities(form.venue_id.data, form.artist_id.data)
+    if missing:
+        for field, message in missing.items():
+            getattr(form, field).errors = [message]
+        return render_template('forms/new_show.html', form=form), 400
     try:
-        form = ShowForm(request.form)
-
         show = Show(
             artist_id=form.artist_id.data,
             venue_id=form.venue_id.data,
-            start_time=form.start_time.data
+            start_time=start_time,
+            end_time=end_time
         )
         db.session.add(show)
         db.session.commit()
         flash('Show: {0} created successfully'.format(show.id))
-    except Exception as err:
-        flash('An error occurred creating the Show: {0}. Error: {1}'.format(show.id, 'Invalid information'))
+    except IntegrityError as err:
+        db.session.rollback()
+        # Overlaps are rejected by the exclusion constraints; report them on the form instead of a generic error.
+        rejected = booking_errors(err, form.venue_id.data, form.artist_id.data, start_time, end_time)
+        if rejected:
+            status, errors = rejected
+            for field, message in errors.items():
+                getattr(form, field).errors = [message]
+            return render_template('forms/new_show.html', form=form), status
+        flash('An error occurred creating the Show. Error: Invalid information')
+    except Exception:
+        flash('An error occurred creating the Show. Error: Invalid information')
         db.session.rollback()
     finally:
         db.session.close()
@@ -471,33 +583,259 @@ def create_show_submission():
     return render_template('pages/home.html'), 201
 
 
-@app.errorhandler(404)
+def batch_dates(text):
+    # One start time per line, as the form says: commas belong to dates like "Oct 10, 2026 8pm".
+    return [value.strip() for value in (text or '').splitlines() if value.strip()]
+
+
+@main.route('/shows/batch')
+def create_show_batch_form():
+    return render_template('forms/new_show_batch.html', form=ShowBatchForm())
+
+
+@main.route('/shows/batch', methods=['POST'])
+def create_show_batch_submission():
+    form = ShowBatchForm(request.form)
+    if not all([field.validate(form) for field in (form.artist_id, form.venue_id, form.start_time, form.duration)]):
+        return render_template('forms/new_show_batch.html', form=form), 400
+    duration = timedelta(minutes=form.duration.data) if form.duration.data else DEFAULT_SHOW_DURATION
+    try:
+        starts = batch_start_times(batch_dates(form.dates.data), (form.rrule.data or '').strip(), form.start_time.data,
+                                   current_app.config['BATCH_SHOWS_MAX'])
+        result = book_shows(form.venue_id.data, form.artist_id.data, starts, duration, form.allow_partial.data)
+    except BatchError as err:
+        for field, message in err.errors.items():
+            getattr(form, field).errors = [message]
+        return render_template('forms/new_show_batch.html', form=form), err.status
+    finally:
+        db.session.close()
+
+    if result.created:
+        flash('{0} shows created successfully'.format(len(result.created)))
+    return render_template('forms/new_show_batch.html', form=form, result=result), 201 if result.created else 409
+
+
+'''
+EXPORT
+'''
+
+
+@main.route('/export/<any(venues, artists, shows):entity>.<any(ndjson, csv):fmt>')
+@main.route('/export/<any(venues, artists, shows):entity>.<any(ndjson, csv):fmt>.gz', defaults={'gzip': True})
+def export_catalogue(entity, fmt, gzip=False):
+    filename = '{0}.{1}{2}'.format(entity, fmt, '.gz' if gzip else '')
+    chunks = export_chunks(entity, fmt, current_app.config['EXPORT_BATCH_SIZE'],
+                           current_app.config['EXPORT_CHUNK_SIZE'], gzip)
+    return Response(stream_with_context(chunks),
+                    mimetype='application/gzip' if gzip else FORMATS[fmt],
+                    headers={'Content-Disposition': 'attachment; filename={0}'.format(filename)})
+
+
+@main.route('/export/<any(venues, artists, shows):entity>.<any(ndjson, csv):fmt>', methods=['POST'])
+@main.route('/export/<any(venues, artists, shows):entity>.<any(ndjson, csv):fmt>.gz', methods=['POST'],
+            defaults={'gzip': True})
+def queue_export(entity, fmt, gzip=False):
+    return job_response(jobs.enqueue('export', entity=entity, fmt=fmt, gzip=gzip), 202)
+
+
+'''
+IMPORT
+'''
+
+
+@main.route('/import/<any(venues, artists, shows):entity>', methods=['POST'])
+def queue_import(entity):
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return json.dumps({'success': False, 'error': 'Upload the file to import as "file"'}), 400
+    fmt = request.values.get('format') or ('csv' if upload.filename.lower().endswith('.csv') else 'jsonl')
+    if fmt not in ('csv', 'jsonl'):
+        return json.dumps({'success': False, 'error': 'format must be csv or jsonl'}), 400
+    name = 'upload-{0}.{1}'.format(uuid.uuid4().hex, fmt)
+    upload.save(jobs.path(name))
+    return job_response(jobs.enqueue('import', entity=entity, upload=name, fmt=fmt,
+                                     batch_size=request.values.get('batch_size', 1000, type=int)), 202)
+
+
+'''
+JOBS
+'''
+
+
+@jobs.task('purge-deleted', max_attempts=5, every='PURGE_INTERVAL_SECONDS')
+def purge_deleted_job(job):
+    return purge_deleted(db.session, current_app.config['PURGE_BATCH_SIZE'],
+                         current_app.config['PURGE_PAUSE_SECONDS'])._asdict()
+
+
+# Jobs that leave every process's local caches stale. The memory cache, the fragment cache and the typeahead
+# indexes live in each process; the Job table is what all of them share, so its last such success is the
+# version token each process rebuilds against.
+CACHE_REBUILD_KINDS = ('rebuild-caches', 'import')
+
+
+@main.before_app_request
+def sync_local_caches():
+    interval = current_app.config['CACHE_SYNC_SECONDS']
+    state = current_app.extensions.setdefault('cache_sync', {'checked_at': None, 'version': None})
+    now = time.monotonic()
+    if not interval or state['checked_at'] is not None and now - state['checked_at'] < interval:
+        return
+    first_check = state['checked_at'] is None
+    state['checked_at'] = now
+    version = jobs.last_succeeded(CACHE_REBUILD_KINDS)
+    if version is None or state['version'] is not None and version <= state['version']:
+        return
+    state['version'] = version
+    if first_check:
+        # A new process builds its caches from scratch anyway.
+        return
+    if not cache.backend.shared:
+        cache.clear()
+    fragment_cache.clear()
+    typeahead.refresh()
+
+
+@jobs.task('rebuild-caches')
+def rebuild_caches_job(job):
+    # The other processes follow through sync_local_caches once the job has succeeded.
+    cache.clear()
+    fragment_cache.clear()
+    cache.set(VENUE_AREAS_CACHE_KEY, venue_areas(), current_app.config['VENUE_AREAS_CACHE_TTL'])
+    typeahead.build()
+    return typeahead.stats()['indexes']
+
+
+@jobs.task('export')
+def export_job(job, entity, fmt, gzip=False):
+    name = 'export-{0}-{1}.{2}{3}'.format(job.id, entity, fmt, '.gz' if gzip else '')
+    size = 0
+    with open(jobs.path(name + '.part'), 'wb') as output:
+        for chunk in export_chunks(entity, fmt, current_app.config['EXPORT_BATCH_SIZE'],
+                                   current_app.config['EXPORT_CHUNK_SIZE'], gzip):
+            output.write(chunk)
+            size += len(chunk)
+    os.replace(jobs.path(name + '.part'), jobs.path(name))
+    return {'file': name, 'bytes': size, 'host': socket.gethostname()}
+
+
+# A single attempt: batches are committed as they go, so running the file again would insert them twice.
+@jobs.task('import', max_attempts=1)
+def import_job(job, entity, upload, fmt, batch_size=1000):
+    name = 'import-{0}-{1}.rejects.jsonl'.format(job.id, entity)
+    try:
+        with open(jobs.path(name), 'w', encoding='utf-8') as rejects:
+            stats = import_file(db.session, entity, jobs.path(upload), fmt, batch_size, reject_writer(rejects))
+    finally:
+        os.remove(jobs.path(upload))
+    if not stats.rejected:
+        os.remove(jobs.path(name))
+    venues_changed()
+    artists_changed()
+    typeahead.build()
+    return dict(stats._asdict(), file=name if stats.rejected else None, host=socket.gethostname())
+
+
+def job_response(job_id, status=200):
+    job = jobs.get(job_id)
+    if job is None:
+        return json.dumps({
+            'success':
+                False,
+            'error':
+                'Job #{0} not found'.format(job_id)
+        }), 404
+    data = job_dict(job)
+    if job.result and job.result.get('file'):
+        data['download'] = url_for('main.job_file', job_id=job.id)
+    return Response(json.dumps(data), status=status, mimetype='application/json',
+                    headers={'Location': url_for('main.job_status', job_id=job.id)})
+
+
+@main.route('/jobs')
+def job_list():
+    query = Job.query.order_by(Job.id.desc())
+    if request.args.get('kind'):
+        query = query.filter(Job.kind == request.args['kind'])
+    if request.args.get('status'):
+        query = query.filter(Job.status == request.args['status'])
+    return Response(json.dumps([job_dict(job) for job in query.limit(50)]), mimetype='application/json')
+
+
+@main.route('/jobs/<any("purge-deleted", "rebuild-caches"):kind>', methods=['POST'])
+def queue_job(kind):
+    return job_response(jobs.enqueue(kind, unique=True), 202)
+
+
+@main.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    return job_response(job_id)
+
+
+@main.route('/jobs/<int:job_id>/file')
+def job_file(job_id):
+    job = jobs.get(job_id)
+    if job is None or not job.result or not job.result.get('file'):
+        return json.dumps({
+            'success':
+                False,
+            'error':
+                'Job #{0} has no file'.format(job_id)
+        }), 404
+    if not os.path.exists(os.path.join(current_app.config['JOB_FILES_DIR'], job.result['file'])):
+        # Pruned, or written to a JOB_FILES_DIR this process can't see.
+        return json.dumps({
+            'success':
+                False,
+            'error':
+                'The file of job #{0} (written on {1}) is not in JOB_FILES_DIR, which must be shared by the web '
+                'and job processes'.format(job_id, job.result.get('host') or 'an unknown host')
+        }), 404
+    return send_from_directory(current_app.config['JOB_FILES_DIR'], job.result['file'], as_attachment=True)
+
+
+@main.route('/_stats/jobs')
+def job_stats():
+    return Response(json.dumps(jobs.stats()), mimetype='application/json')
+
+
+@main.route('/_stats/cache')
+def cache_stats():
+    return Response(json.dumps(dict(cache.stats(), fragments=fragment_cache.stats())), mimetype='application/json')
+
+
+@main.route('/_stats/typeahead')
+def typeahead_stats():
+    return Response(json.dumps(typeahead.stats()), mimetype='application/json')
+
+
+@main.route('/_stats/pool')
+def pool_stats_view():
+    return Response(json.dumps(pool_stats(db.engine)), mimetype='application/json')
+
+
+@main.route('/_stats/replicas')
+def replica_stats():
+    return Response(json.dumps(replica_router.stats()), mimetype='application/json')
+
+
+@main.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
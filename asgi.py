@@ -0,0 +1,298 @@
+"""Optional ASGI entry point (requires asyncpg and asgiref):
+
+    $ uvicorn asgi:application
+
+The read-only pages run as coroutines on an asyncpg pool, so a slow client or query does not hold a
+worker thread; they reuse the app's URL rules, queries and templates. Every other route is served by
+the regular WSGI app through asgiref.
+"""
+import asyncio
+import itertools
+import json
+import re
+import time
+from datetime import datetime
+from urllib.parse import parse_qs
+from flask import g, render_template
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+from werkzeug.exceptions import HTTPException
+from app import create_app, VENUE_AREAS_CACHE_KEY, requested_filters, requested_search_term, requested_shows_cursor, \
+    render_search, render_venue, render_artist, render_shows
+from cache import cache, MISSING
+from instrumentation import slow_query_logger, normalize_sql
+from model import Venue, Artist, Show
+from queries import NO_FILTERS, AreaRow, NameRow, SearchRow, ShowRow, ShowCardRow, VenueDetailRow, ArtistDetailRow, \
+    venue_areas_query, artist_names_query, venue_detail_query, artist_detail_query, shows_listing, \
+    search_by_name_query, upcoming_and_past_statement, split_upcoming_and_past
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    WsgiToAsgi = None
+
+# Statements are compiled for psycopg2's positional %s style, then renumbered as asyncpg's $1, $2, ...
+DIALECT = PGDialect_psycopg2(paramstyle='format')
+PLACEHOLDER = re.compile(r'%%|%s')
+
+
+def compile_statement(statement):
+    compiled = getattr(statement, 'statement', statement).compile(dialect=DIALECT)
+    position = itertools.count(1)
+    sql = PLACEHOLDER.sub(lambda match: '%' if match.group() == '%%' else '${0}'.format(next(position)),
+                          compiled.string)
+    return sql, [compiled.params[name] for name in compiled.positiontup]
+
+
+def asyncpg_dsn(uri):
+    return re.sub(r'^postgres(?:ql)?(?:\+\w+)?://', 'postgresql://', uri)
+
+
+def error(message, status):
+    return json.dumps({
+        'success': False,
+        'error': message
+    }), status
+
+
+async def init_connection(connection):
+    # psycopg2 decodes json values into Python objects; asyncpg returns text unless told otherwise.
+    await connection.set_type_codec('json', encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+class AsyncRequest(object):
+    # Flask 1.x keeps its contexts in thread-local storage, which every coroutine on the loop shares,
+    # so a context is only ever pushed around synchronous code and never held across an await.
+
+    def __init__(self, service, scope, body, endpoint):
+        self.service = service
+        self.app = service.app
+        self.scope = scope
+        self.body = body
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+
+    def context(self):
+        headers = [(name.decode('latin-1'), value.decode('latin-1')) for name, value in self.scope['headers']]
+        host = dict((name.lower(), value) for name, value in headers).get('host', 'localhost')
+        return self.app.test_request_context(
+            self.scope['path'],
+            base_url='{0}://{1}{2}'.format(self.scope.get('scheme', 'http'), host, self.scope.get('root_path', '')),
+            method=self.scope['method'],
+            headers=headers,
+            data=self.body,
+            query_string=self.scope.get('query_string', b''))
+
+    async def fetch(self, row_type, statement):
+        sql, params = compile_statement(statement)
+        pool = await self.service.connect()
+        started = time.perf_counter()
+        async with pool.acquire() as connection:
+            records = await connection.fetch(sql, *params)
+        elapsed = time.perf_counter() - started
+        self.sql_count += 1
+        self.sql_time += elapsed
+        threshold = self.app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000.0
+        if self.app.config['SQL_INSTRUMENTATION'] and elapsed >= threshold:
+            slow_query_logger.warning({
+                'duration_ms': round(elapsed * 1000, 3),
+                'sql': normalize_sql(sql),
+                'call_site': 'asgi',
+                'endpoint': self.endpoint,
+                'executemany': False,
+            })
+        return [row_type._make(record) for record in records]
+
+    def respond(self, view):
+        with self.context():
+            # Seeds the same per-request timings the WSGI app reports in its Server-Timing header.
+            g.request_started = self.started
+            g.sql_count = self.sql_count
+            g.sql_time = self.sql_time
+            g.template_time = 0.0
+            return self.app.process_response(self.app.make_response(view()))
+
+    def respond_to_exception(self, err):
+        with self.context():
+            try:
+                rv = self.app.handle_user_exception(err)
+            except Exception:
+                rv = self.app.handle_exception(err)
+            return self.app.process_response(self.app.make_response(rv))
+
+
+class AsyncReadApp(object):
+
+    def __init__(self, app):
+        if asyncpg is None or WsgiToAsgi is None:
+            raise RuntimeError('ASGI mode needs the asyncpg and asgiref packages')
+        self.app = app
+        self.wsgi = WsgiToAsgi(app)
+        self.pool = None
+        self._pool_lock = None
+        self.views = {
+            'main.venues': self.venues,
+            'main.search_venues': self.search_venues,
+            'main.show_venue': self.show_venue,
+            'main.artists': self.artists,
+            'main.search_artists': self.search_artists,
+            'main.show_artist': self.show_artist,
+            'main.shows': self.shows,
+        }
+
+    async def connect(self):
+        if self.pool is None:
+            if self._pool_lock is None:
+                self._pool_lock = asyncio.Lock()
+            async with self._pool_lock:
+                if self.pool is None:
+                    options = self.app.config['SQLALCHEMY_ENGINE_OPTIONS']
+                    self.pool = await asyncpg.create_pool(
+                        asyncpg_dsn(self.app.config['SQLALCHEMY_DATABASE_URI']),
+                        min_size=options.get('pool_size', 5),
+                        max_size=options.get('pool_size', 5) + max(options.get('max_overflow', 10), 0),
+                        max_inactive_connection_lifetime=options.get('pool_recycle', 1800),
+                        server_settings={'statement_timeout': str(self.app.config['DB_STATEMENT_TIMEOUT_MS'])},
+                        init=init_connection)
+        return self.pool
+
+    def match(self, scope):
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'POST'):
+            return None
+        try:
+            endpoint, view_args = self.app.url_map.bind('localhost').match(scope['path'], scope['method'])
+        except HTTPException:
+            return None
+        if endpoint == 'main.shows' and parse_qs(scope.get('query_string', b'').decode('latin-1')).get('stream'):
+            # Streamed /shows renders while it reads a server-side cursor; that stays on the WSGI side.
+            return None
+        if endpoint not in self.views:
+            return None
+        return endpoint, view_args
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        matched = self.match(scope)
+        if matched is None:
+            return await self.wsgi(scope, receive, send)
+
+        endpoint, view_args = matched
+        request = AsyncRequest(self, scope, await read_body(receive), endpoint)
+        try:
+            response = await self.views[endpoint](request, **view_args)
+        except Exception as err:
+            response = request.respond_to_exception(err)
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.headers.to_wsgi_list()],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': response.get_data(),
+        })
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.connect()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.pool is not None:
+                    await self.pool.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def venues(self, request):
+        with request.context():
+            filters = requested_filters()
+            statement = venue_areas_query(filters)
+        if filters != NO_FILTERS:
+            areas = await request.fetch(AreaRow, statement)
+        else:
+            # The cache is the app's, so it is only touched inside an app context, and never across an await.
+            with self.app.app_context():
+                areas = cache.get(VENUE_AREAS_CACHE_KEY)
+            if areas is MISSING:
+                areas = await request.fetch(AreaRow, statement)
+                with self.app.app_context():
+                    cache.set(VENUE_AREAS_CACHE_KEY, areas, self.app.config['VENUE_AREAS_CACHE_TTL'])
+        return request.respond(lambda: render_template('pages/venues.html', areas=areas))
+
+    async def artists(self, request):
+        with request.context():
+            statement = artist_names_query(requested_filters())
+        artists = await request.fetch(NameRow, statement)
+        return request.respond(lambda: render_template('pages/artists.html', artists=artists))
+
+    async def search(self, request, model, template_name):
+        with request.context():
+            search_term = requested_search_term()
+            statement = search_by_name_query(model, search_term, self.app.config['SEARCH_RESULT_LIMIT'],
+                                             requested_filters()) if search_term else None
+        if statement is None:
+            return request.respond(lambda: error('Missing params.', 400))
+        results = await request.fetch(SearchRow, statement)
+        return request.respond(lambda: render_search(template_name, results, search_term))
+
+    async def search_venues(self, request):
+        return await self.search(request, Venue, 'pages/search_venues.html')
+
+    async def search_artists(self, request):
+        return await self.search(request, Artist, 'pages/search_artists.html')
+
+    async def show_venue(self, request, venue_id):
+        now = datetime.now()
+        with self.app.app_context():
+            statement = venue_detail_query(venue_id, now)
+        venues = await request.fetch(VenueDetailRow, statement)
+        if not venues:
+            return request.respond(lambda: error('Venue #{0} not found'.format(venue_id), 404))
+        upcoming, past = split_upcoming_and_past(await request.fetch(ShowCardRow, upcoming_and_past_statement(
+            Show.venue_id, venue_id, Artist, Show.artist_id, now, self.app.config['DETAIL_SHOWS_LIMIT'])))
+        return request.respond(lambda: render_venue(venues[0], upcoming, past))
+
+    async def show_artist(self, request, artist_id):
+        now = datetime.now()
+        with self.app.app_context():
+            statement = artist_detail_query(artist_id, now)
+        artists = await request.fetch(ArtistDetailRow, statement)
+        if not artists:
+            return request.respond(lambda: error('Artist #{0} not found'.format(artist_id), 404))
+        upcoming, past = split_upcoming_and_past(await request.fetch(ShowCardRow, upcoming_and_past_statement(
+            Show.artist_id, artist_id, Venue, Show.venue_id, now, self.app.config['DETAIL_SHOWS_LIMIT'])))
+        return request.respond(lambda: render_artist(artists[0], upcoming, past))
+
+    async def shows(self, request):
+        page_size = self.app.config['SHOWS_PAGE_SIZE']
+        with request.context():
+            try:
+                statement = shows_listing(requested_shows_cursor()).limit(page_size + 1)
+            except ValueError as err:
+                statement, message = None, str(err)
+        if statement is None:
+            return request.respond(lambda: error(message, 400))
+        rows = await request.fetch(ShowRow, statement)
+        return request.respond(lambda: render_shows(rows, page_size))
+
+
+application = AsyncReadApp(create_app())
@@ -0,0 +1,207 @@
+"""Fingerprinted, precompressed static assets.
+
+`flask build-assets` copies every file under static/ into static/dist/ with a content hash in its name
+(css/main.css -> css/main.3f2a9c1d07.css), minifies css and js that aren't already minified and writes
+.gz (and .br, with the brotli package) variants next to each compressible file. manifest.json maps the
+original names to the built ones; templates call asset_url('css/main.css') to get the fingerprinted URL,
+which is served with the best encoding the client accepts and cached for a year.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.exceptions import NotFound
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+logger = logging.getLogger('fyyur.assets')
+
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = {'.css', '.js', '.map', '.svg', '.json', '.txt', '.ttf', '.otf', '.eot'}
+# Smaller files gain less from compression than the Content-Encoding round trip costs.
+MIN_COMPRESS_SIZE = 512
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+CSS_COMMENT = re.compile(r'/\*(?!!).*?\*/', re.S)
+
+
+def minify_css(text):
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    # Comments and whitespace only; anything that could change a selector or value is left alone.
+    text = CSS_COMMENT.sub('', text)
+    text = re.sub(r'\s+', ' ', text)
+    return re.sub(r'\s*([{};,])\s*', r'\1', text).strip()
+
+
+def minify_js(text):
+    # Without rjsmin, scripts are only compressed: safely minifying JavaScript needs a real tokenizer.
+    return rjsmin.jsmin(text) if rjsmin is not None else text
+
+
+def is_minified(name):
+    return '.min.' in posixpath.basename(name)
+
+
+def fingerprinted(name, content):
+    root, ext = posixpath.splitext(name)
+    return '{0}.{1}{2}'.format(root, hashlib.sha256(content).hexdigest()[:10], ext)
+
+
+def rewrite_css_urls(name, text, manifest):
+    # Fonts and images referenced from a stylesheet must point at their fingerprinted copies too.
+    def replace(match):
+        quote, url = match.groups()
+        if re.match(r'^(?:[a-z]+:|//|/|#)', url):
+            return match.group()
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(name), path))
+        if target not in manifest:
+            return match.group()
+        built = posixpath.relpath(manifest[target], posixpath.dirname(name) or '.')
+        return 'url({0}{1}{2}{0})'.format(quote, built, suffix)
+    return CSS_URL.sub(replace, text)
+
+
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def compress(path, content):
+    if len(content) < MIN_COMPRESS_SIZE:
+        return
+    gzipped = gzip.compress(content, 9, mtime=0)
+    if len(gzipped) < len(content):
+        write_file(path + '.gz', gzipped)
+    if brotli is not None:
+        compressed = brotli.compress(content, quality=11)
+        if len(compressed) < len(content):
+            write_file(path + '.br', compressed)
+
+
+def build_assets(static_folder, output_dir):
+    """Build output_dir from static_folder and return the manifest {source name: built name}.
+
+    Files from earlier builds are kept, so pages rendered before a deploy can still load their assets.
+    """
+    sources = []
+    output_dir = os.path.abspath(output_dir)
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.abspath(root) == output_dir:
+            dirs[:] = []
+            continue
+        for filename in files:
+            path = os.path.join(root, filename)
+            sources.append(os.path.relpath(path, static_folder).replace(os.sep, '/'))
+
+    manifest = {}
+    # Stylesheets last, once the fonts and images they reference have their fingerprinted names.
+    for name in sorted(sources, key=lambda name: (name.endswith('.css'), name)):
+        with open(os.path.join(static_folder, name), 'rb') as f:
+            content = f.read()
+        ext = posixpath.splitext(name)[1].lower()
+        if ext == '.css':
+            text = rewrite_css_urls(name, content.decode('utf-8'), manifest)
+            content = (text if is_minified(name) else minify_css(text)).encode('utf-8')
+        elif ext == '.js' and not is_minified(name):
+            content = minify_js(content.decode('utf-8')).encode('utf-8')
+
+        built = fingerprinted(name, content)
+        path = os.path.join(output_dir, built)
+        write_file(path, content)
+        if ext in COMPRESSIBLE:
+            compress(path, content)
+        manifest[name] = built
+
+    write_file(os.path.join(output_dir, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    unminified = [name for name in sources if name.endswith('.js') and not is_minified(name)]
+    if rjsmin is None and unminified:
+        logger.warning('rjsmin is not installed: %d scripts were copied without minification', len(unminified))
+    if rcssmin is None and any(name.endswith('.css') and not is_minified(name) for name in sources):
+        logger.warning('rcssmin is not installed: stylesheets were only stripped of comments and whitespace')
+    return manifest
+
+
+def accepted_encodings():
+    accepted = request.accept_encodings
+    return [encoding for encoding in ('br', 'gzip') if accepted[encoding]]
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        # Not built (e.g. in development): asset_url falls back to the plain /static URLs.
+        return {}
+
+
+class Assets(object):
+    """Serves the built assets; each app's manifest is kept in app.extensions['assets']."""
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_DIR', os.path.join(app.static_folder, 'dist'))
+        app.config.setdefault('ASSETS_URL_PATH', '/assets')
+        app.config.setdefault('ASSETS_MAX_AGE', 365 * 24 * 3600)
+        app.extensions['assets'] = {'manifest': read_manifest(app.config['ASSETS_DIR'])}
+        app.add_url_rule(app.config['ASSETS_URL_PATH'] + '/<path:filename>', 'asset', self.serve)
+        app.add_template_global(self.url, 'asset_url')
+
+    @property
+    def manifest(self):
+        return current_app.extensions['assets']['manifest']
+
+    def build(self):
+        manifest = build_assets(current_app.static_folder, current_app.config['ASSETS_DIR'])
+        current_app.extensions['assets']['manifest'] = manifest
+        return manifest
+
+    def url(self, name):
+        built = self.manifest.get(name)
+        if built is None:
+            return url_for('static', filename=name)
+        return url_for('asset', filename=built)
+
+    def serve(self, filename):
+        directory = current_app.config['ASSETS_DIR']
+        if filename == MANIFEST or filename.endswith(('.gz', '.br')):
+            raise NotFound()
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding = None
+        for candidate in accepted_encodings():
+            suffix = '.br' if candidate == 'br' else '.gz'
+            if os.path.isfile(os.path.join(directory, filename + suffix)):
+                encoding, filename = candidate, filename + suffix
+                break
+
+        # The name changes with the content, so a browser never needs to revalidate it.
+        response = send_from_directory(directory, filename, mimetype=mimetype,
+                                       cache_timeout=current_app.config['ASSETS_MAX_AGE'])
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+
+assets = Assets()
@@ -0,0 +1,45 @@
+"""Per-row cost of formatting a show's start time, before and after the formatting module.
+
+    $ python benchmarks/format_datetime.py [rows]
+"""
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formatting import format_datetime  # noqa: E402
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "MM, d, y 'at' h:m"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def main(rows=2000, repeat=5):
+    start_times = [datetime(2020, 1, 1, 20, 30) + timedelta(hours=index) for index in range(rows)]
+
+    def legacy():
+        # /shows formatted str(start_time) in the view, then the template filter re-parsed and re-formatted it.
+        for start_time in start_times:
+            legacy_format_datetime(legacy_format_datetime(str(start_time), 'full'), 'full')
+
+    def current():
+        for start_time in start_times:
+            format_datetime(start_time, 'full')
+
+    for name, run in (('legacy', legacy), ('current', current)):
+        best = min(timeit.repeat(run, number=1, repeat=repeat))
+        print('{0:<8} {1:8.2f} us/row'.format(name, best / rows * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
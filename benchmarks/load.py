@@ -0,0 +1,257 @@
+"""Drive every route with concurrent clients and report throughput and latency percentiles per route.
+
+    $ python benchmarks/load.py --url http://127.0.0.1:5000 --venues 100000 --artists 50000 -o report.json
+    $ python benchmarks/load.py ... --baseline benchmarks/baseline.json   # exits 1 on a regression
+
+Run it against a database seeded by benchmarks/seed.py with the same --venues/--artists/--seed.
+Each route is measured in its own phase, so its throughput is not diluted by the others.
+Write routes create and edit rows; pass --read-only to leave the data set untouched.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from seed import ADJECTIVES, GENRES, NOUNS, PLACES  # noqa: E402
+
+FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+# request(rng) -> (path, form fields or None); write routes are skipped with --read-only.
+Route = namedtuple('Route', ['name', 'method', 'request', 'write'])
+
+# A form value filled in just before the request with the version shown on the path's edit form, the way a
+# browser editing the row would send it. Fetching the form is not measured.
+CURRENT_VERSION = object()
+VERSION_INPUT = re.compile(r'name="version" value="(\d+)"')
+
+
+def routes(venues, artists):
+    def fixed(path):
+        return lambda rng: (path, None)
+
+    def venue_fields(rng):
+        city, state = rng.choice(PLACES)
+        return {
+            'name': 'Bench {0} {1}'.format(rng.choice(ADJECTIVES), rng.choice(NOUNS)),
+            'city': city,
+            'state': state,
+            'address': '{0} Bench St'.format(rng.randint(1, 9999)),
+            'phone': '415-000-0000',
+            'genres': rng.sample(GENRES, 2),
+            'facebook_link': 'https://www.facebook.com/bench',
+            'image_link': 'https://images.example.com/bench.jpg',
+        }
+
+    def artist_fields(rng):
+        fields = venue_fields(rng)
+        del fields['address']
+        return fields
+
+    def show_fields(rng):
+        start_time = datetime.utcnow().replace(microsecond=0) + timedelta(minutes=30 * rng.randrange(48 * 365))
+        return {
+            'venue_id': rng.randint(1, venues),
+            'artist_id': rng.randint(1, artists),
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+    return [
+        Route('home', 'GET', fixed('/'), False),
+        Route('venues', 'GET', fixed('/venues'), False),
+        Route('artists', 'GET', fixed('/artists'), False),
+        Route('shows', 'GET', fixed('/shows'), False),
+        Route('venue_detail', 'GET', lambda rng: ('/venues/{0}'.format(rng.randint(1, venues)), None), False),
+        Route('artist_detail', 'GET', lambda rng: ('/artists/{0}'.format(rng.randint(1, artists)), None), False),
+        Route('venue_search', 'POST', lambda rng: ('/venues/search', {
+            'search_term': rng.choice(ADJECTIVES + NOUNS).lower()[:rng.randint(3, 5)]}), False),
+        Route('artist_search', 'POST', lambda rng: ('/artists/search', {
+            'search_term': rng.choice(ADJECTIVES + NOUNS).lower()[:rng.randint(3, 5)]}), False),
+        Route('venue_edit_form', 'GET', lambda rng: ('/venues/{0}/edit'.format(rng.randint(1, venues)), None),
+              False),
+        Route('artist_edit_form', 'GET', lambda rng: ('/artists/{0}/edit'.format(rng.randint(1, artists)), None),
+              False),
+        Route('api_shows', 'GET', fixed('/api/v1/shows'), False),
+        Route('venue_create', 'POST', lambda rng: ('/venues/create', venue_fields(rng)), True),
+        Route('artist_create', 'POST', lambda rng: ('/artists/create', artist_fields(rng)), True),
+        Route('show_create', 'POST', lambda rng: ('/shows/create', show_fields(rng)), True),
+        Route('venue_edit', 'PATCH', lambda rng: ('/venues/{0}/edit'.format(rng.randint(1, venues)), {
+            'name': 'Bench {0} Hall'.format(rng.choice(NOUNS)), 'version': CURRENT_VERSION}), True),
+        Route('artist_edit', 'PATCH', lambda rng: ('/artists/{0}/edit'.format(rng.randint(1, artists)), {
+            'name': 'The Bench {0}s'.format(rng.choice(NOUNS)), 'version': CURRENT_VERSION}), True),
+    ]
+
+
+def percentile(ordered, fraction):
+    # Nearest-rank percentile of an already sorted list.
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def current_version(connection, path):
+    connection.request('GET', path)
+    response = connection.getresponse()
+    match = VERSION_INPUT.search(response.read().decode('utf-8', 'replace'))
+    return match.group(1) if match else ''
+
+
+def run_phase(url, route, count, concurrency, seed):
+    # The request list is generated up front from the seed, so every run sends the same requests.
+    rng = random.Random('{0}:{1}'.format(seed, route.name))
+    requests = [route.request(rng) for _ in range(count)]
+    # A 409 is an edit that lost a race with another client: expected under concurrency, so not an error.
+    latencies, errors, conflicts = [], [], []
+    lock = threading.Lock()
+    position = [0]
+    target = urlsplit(url)
+
+    def worker():
+        connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=60)
+        while True:
+            with lock:
+                if position[0] >= len(requests):
+                    break
+                path, fields = requests[position[0]]
+                position[0] += 1
+            started = None
+            try:
+                if fields is not None and fields.get('version') is CURRENT_VERSION:
+                    fields = dict(fields, version=current_version(connection, target.path.rstrip('/') + path))
+                body = urlencode(fields, doseq=True) if fields is not None else None
+                started = time.perf_counter()
+                connection.request(route.method, target.path.rstrip('/') + path, body=body,
+                                   headers=FORM_HEADERS if body is not None else {})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException) as err:
+                connection.close()
+                status = type(err).__name__
+            elapsed = time.perf_counter() - (started or time.perf_counter())
+            with lock:
+                latencies.append(elapsed)
+                if status == 409:
+                    conflicts.append(status)
+                elif not isinstance(status, int) or status >= 400:
+                    errors.append(status)
+        connection.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'error_statuses': sorted({str(status) for status in errors}),
+        'conflicts': len(conflicts),
+        'seconds': round(seconds, 3),
+        'throughput_rps': round(len(latencies) / seconds, 2) if seconds else None,
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+            'p50': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+            'p95': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+            'p99': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+            'max': round(latencies[-1] * 1000, 2) if latencies else None,
+        },
+    }
+
+
+def regressions(report, baseline, tolerance):
+    found = []
+    for name, result in report['routes'].items():
+        previous = baseline.get('routes', {}).get(name)
+        if not previous:
+            continue
+        for percentile_name in ('p95', 'p99'):
+            now, before = result['latency_ms'][percentile_name], previous['latency_ms'][percentile_name]
+            if now is not None and before and now > before * (1 + tolerance):
+                found.append('{0}: {1} {2}ms -> {3}ms'.format(name, percentile_name, before, now))
+        now, before = result['throughput_rps'], previous['throughput_rps']
+        if now is not None and before and now < before * (1 - tolerance):
+            found.append('{0}: throughput {1}/s -> {2}/s'.format(name, before, now))
+        if result['errors'] > previous['errors']:
+            found.append('{0}: errors {1} -> {2}'.format(name, previous['errors'], result['errors']))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--venues', type=int, default=100000, help='Venue ids are drawn from 1..N.')
+    parser.add_argument('--artists', type=int, default=50000, help='Artist ids are drawn from 1..N.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per route.')
+    parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per route, sent first.')
+    parser.add_argument('--route', action='append', dest='only', help='Only run this route (repeatable).')
+    parser.add_argument('--read-only', action='store_true', help='Skip the create and edit routes.')
+    parser.add_argument('-o', '--output', help='Write the JSON report here instead of stdout.')
+    parser.add_argument('--baseline', help='A previous report; exit 1 when a route regressed. Skipped if missing.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative change against the baseline (default 0.2 = 20%%).')
+    args = parser.parse_args()
+
+    selected = [route for route in routes(args.venues, args.artists)
+                if (not args.only or route.name in args.only) and not (args.read_only and route.write)]
+    report = {
+        'config': {
+            'url': args.url,
+            'venues': args.venues,
+            'artists': args.artists,
+            'seed': args.seed,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'python': platform.python_version(),
+            'started_at': datetime.utcnow().isoformat(),
+        },
+        'routes': {},
+    }
+    for route in selected:
+        if args.warmup:
+            run_phase(args.url, route, args.warmup, args.concurrency, 'warmup:{0}'.format(args.seed))
+        result = run_phase(args.url, route, args.requests, args.concurrency, args.seed)
+        report['routes'][route.name] = result
+        print('{0:<18} {1:>8.1f} req/s  p50 {2:>8.2f}ms  p95 {3:>8.2f}ms  p99 {4:>8.2f}ms  errors {5}  '
+              'conflicts {6}'.format(route.name, result['throughput_rps'] or 0, result['latency_ms']['p50'] or 0,
+                                     result['latency_ms']['p95'] or 0, result['latency_ms']['p99'] or 0,
+                                     result['errors'], result['conflicts']),
+              file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline and not os.path.exists(args.baseline):
+        print('No baseline at {0}; nothing to compare against.'.format(args.baseline), file=sys.stderr)
+    elif args.baseline:
+        with open(args.baseline) as source:
+            found = regressions(report, json.load(source), args.tolerance)
+        for line in found:
+            print('REGRESSION ' + line, file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
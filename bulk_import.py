@@ -0,0 +1,225 @@
+import csv
+import json
+import time
+from collections import namedtuple
+import dateutil.parser
+from sqlalchemy import ARRAY, Boolean, DateTime, Integer, String, and_, func, select
+from sqlalchemy.exc import DBAPIError
+from model import Venue, Artist, Show
+
+MODELS = {
+    'venues': Venue,
+    'artists': Artist,
+    'shows': Show,
+}
+
+# Mirrors the DataRequired validators of the create forms.
+REQUIRED_FIELDS = {
+    'venues': ('name', 'city', 'state', 'address'),
+    'artists': ('name', 'city', 'state'),
+    'shows': ('start_time',),
+}
+
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y')
+FALSE_VALUES = ('0', 'false', 'f', 'no', 'n')
+
+ImportStats = namedtuple('ImportStats', ['inserted', 'rejected', 'seconds'])
+
+
+class RejectedRow(ValueError):
+    pass
+
+
+def read_records(path, fmt):
+    with open(path, newline='', encoding='utf-8') as source:
+        if fmt == 'csv':
+            for line_number, record in enumerate(csv.DictReader(source), start=2):
+                yield line_number, record
+        else:
+            for line_number, line in enumerate(source, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as err:
+                    yield line_number, RejectedRow('Invalid JSON: {0}'.format(err))
+                    continue
+                yield line_number, record
+
+
+def coerce(column, value):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    column_type = column.type
+    if isinstance(column_type, ARRAY):
+        if isinstance(value, str):
+            value = value.strip()
+            value = json.loads(value) if value.startswith('[') else \
+                [item.strip() for item in value.replace(';', ',').split(',') if item.strip()]
+        if not isinstance(value, list):
+            raise RejectedRow('{0}: expected a list'.format(column.name))
+        return [str(item) for item in value]
+    if isinstance(column_type, Boolean):
+        if isinstance(value, bool):
+            return value
+        if str(value).strip().lower() in TRUE_VALUES:
+            return True
+        if str(value).strip().lower() in FALSE_VALUES:
+            return False
+        raise RejectedRow('{0}: expected a boolean, got {1!r}'.format(column.name, value))
+    if isinstance(column_type, Integer):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise RejectedRow('{0}: expected an integer, got {1!r}'.format(column.name, value))
+    if isinstance(column_type, DateTime):
+        try:
+            return dateutil.parser.parse(str(value))
+        except (TypeError, ValueError, OverflowError):
+            raise RejectedRow('{0}: expected a date and time, got {1!r}'.format(column.name, value))
+    if isinstance(column_type, String):
+        value = str(value).strip()
+        if column_type.length and len(value) > column_type.length:
+            raise RejectedRow('{0}: longer than {1} characters'.format(column.name, column_type.length))
+    return value
+
+
+def coerce_record(entity, table, record):
+    if not isinstance(record, dict):
+        raise RejectedRow('Expected an object per row')
+    row = {}
+    for column in table.columns:
+        if column.name in record:
+            value = coerce(column, record[column.name])
+            if value is not None:
+                row[column.name] = value
+    for field in REQUIRED_FIELDS[entity]:
+        if row.get(field) is None:
+            raise RejectedRow('{0} is required'.format(field))
+    if entity == 'shows':
+        for reference in ('venue', 'artist'):
+            if reference + '_id' not in row:
+                name = record.get(reference + '_name')
+                if not name or not str(name).strip():
+                    raise RejectedRow('{0}_id or {0}_name is required'.format(reference))
+                row[reference + '_name'] = str(name).strip()
+    return row
+
+
+def resolve_references(session, model, column_prefix, pending):
+    # One id lookup and one name lookup per batch instead of a query per row.
+    id_key, name_key = column_prefix + '_id', column_prefix + '_name'
+    ids = {row[id_key] for _, row, _ in pending if id_key in row}
+    names = {row[name_key] for _, row, _ in pending if id_key not in row}
+    known_ids = set()
+    ids_by_name = {}
+    if ids:
+        known_ids = {row_id for row_id, in session.execute(
+            select([model.id]).where(and_(model.id.in_(ids), model.deleted_at.is_(None))))}
+    if names:
+        ids_by_name = {name: row_ids for name, row_ids in session.execute(
+            select([model.name, func.array_agg(model.id)])
+            .where(and_(model.name.in_(names), model.deleted_at.is_(None)))
+            .group_by(model.name))}
+
+    resolved, failures = [], []
+    for line_number, row, record in pending:
+        name = row.pop(name_key, None)
+        if id_key not in row:
+            matches = ids_by_name.get(name, [])
+            if len(matches) != 1:
+                failures.append((line_number, RejectedRow(
+                    '{0} {1!r} matches {2} rows'.format(column_prefix, name, len(matches))), record))
+                continue
+            row[id_key] = matches[0]
+        elif row[id_key] not in known_ids:
+            failures.append((line_number, RejectedRow(
+                '{0} #{1} does not exist'.format(column_prefix, row[id_key])), record))
+            continue
+        resolved.append((line_number, row, record))
+    pending[:] = resolved
+    return failures
+
+
+def insert_batch(session, table, batch):
+    # One multi-row INSERT per batch; on failure, retry row by row in savepoints to isolate the bad rows.
+    rejects = []
+    shapes = {}
+    for _, row, _ in batch:
+        shapes.setdefault(tuple(sorted(row)), []).append(row)
+    try:
+        for rows in shapes.values():
+            session.execute(table.insert().values(rows))
+        session.commit()
+        return len(batch), rejects
+    except DBAPIError:
+        session.rollback()
+
+    inserted = 0
+    for line_number, row, record in batch:
+        savepoint = session.begin_nested()
+        try:
+            session.execute(table.insert().values(row))
+            savepoint.commit()
+            inserted += 1
+        except DBAPIError as err:
+            savepoint.rollback()
+            rejects.append((line_number, RejectedRow(str(err.orig).strip()), record))
+    session.commit()
+    return inserted, rejects
+
+
+def reject_writer(stream):
+    # on_reject callback for import_file writing each rejected row with its reason as a JSON line.
+    def on_reject(line_number, error, record):
+        stream.write(json.dumps({'line': line_number, 'error': error, 'record': record}, default=str) + '\n')
+    return on_reject
+
+
+def import_file(session, entity, path, fmt, batch_size, on_reject):
+    model = MODELS[entity]
+    table = model.__table__
+    started = time.perf_counter()
+    inserted = rejected = 0
+    explicit_ids = False
+
+    def flush(batch):
+        nonlocal inserted, rejected
+        failures = []
+        if entity == 'shows':
+            failures.extend(resolve_references(session, Venue, 'venue', batch))
+            failures.extend(resolve_references(session, Artist, 'artist', batch))
+        if batch:
+            count, insert_failures = insert_batch(session, table, batch)
+            inserted += count
+            failures.extend(insert_failures)
+        for line_number, err, record in failures:
+            rejected += 1
+            on_reject(line_number, str(err), record)
+        del batch[:]
+
+    batch = []
+    for line_number, record in read_records(path, fmt):
+        if isinstance(record, RejectedRow):
+            rejected += 1
+            on_reject(line_number, str(record), None)
+            continue
+        try:
+            row = coerce_record(entity, table, record)
+        except (RejectedRow, ValueError) as err:
+            rejected += 1
+            on_reject(line_number, str(err), record)
+            continue
+        explicit_ids = explicit_ids or 'id' in row
+        batch.append((line_number, row, record))
+        if len(batch) >= batch_size:
+            flush(batch)
+    flush(batch)
+
+    if explicit_ids:
+        # Rows carrying their own ids leave the serial sequence behind; move it past the largest id.
+        session.execute("SELECT setval(pg_get_serial_sequence('\"{0}\"', 'id'), "
+                        "COALESCE((SELECT MAX(id) FROM \"{0}\"), 1))".format(table.name))
+        session.commit()
+
+    return ImportStats(inserted, rejected, time.perf_counter() - started)
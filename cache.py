@@ -0,0 +1,178 @@
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import current_app
+
+MISSING = object()
+
+
+class MemoryBackend(object):
+    # Per-process LRU with a TTL on every entry.
+    shared = False
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend(object):
+    # Shared between workers and hosts, so an invalidation in one process is seen by all of them.
+    shared = True
+
+    def __init__(self, url, prefix='fyyur:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_BACKEND=redis requires the redis package (pip install redis)')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        payload = self.client.get(self.prefix + key)
+        return MISSING if payload is None else pickle.loads(payload)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=ttl or None)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(self.prefix + '*'))
+
+
+class CacheState(object):
+    # What the cache keeps per app: one app's backend and counters never serve another's.
+
+    def __init__(self, backend, default_ttl):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.counters = {}
+        self.lock = threading.Lock()
+
+
+class Cache(object):
+    """The cache of the current app; init_app puts its backend and counters in app.extensions['cache']."""
+
+    def __init__(self, app=None, backend=None):
+        self._backend = backend
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_BACKEND', 'memory')
+        app.config.setdefault('CACHE_DEFAULT_TTL', 300)
+        app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+        backend = self._backend
+        if backend is None:
+            if app.config['CACHE_BACKEND'] == 'redis':
+                backend = RedisBackend(app.config['CACHE_REDIS_URL'])
+            else:
+                backend = MemoryBackend(app.config['CACHE_MAX_ENTRIES'])
+        app.extensions['cache'] = CacheState(backend, app.config['CACHE_DEFAULT_TTL'])
+
+    @property
+    def state(self):
+        return current_app.extensions['cache']
+
+    @property
+    def backend(self):
+        return self.state.backend
+
+    def _count(self, label, outcome):
+        # Counters are kept per label, a fixed name, so keys built from request input can't grow them.
+        state = self.state
+        with state.lock:
+            counters = state.counters.setdefault(label, {'hits': 0, 'misses': 0, 'invalidations': 0})
+            counters[outcome] += 1
+
+    def get(self, key, label=None):
+        value = self.backend.get(key)
+        self._count(label or key, 'misses' if value is MISSING else 'hits')
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl if ttl is not None else self.state.default_ttl)
+
+    def get_or_set(self, key, factory, ttl=None, label=None):
+        value = self.get(key, label)
+        if value is MISSING:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, *keys):
+        self.backend.delete(*keys)
+        for key in keys:
+            self._count(key, 'invalidations')
+
+    def namespace(self, name):
+        # Keys built on this token are dropped together by replacing it; an evicted token drops them too.
+        token = self.backend.get('namespace:' + name)
+        if token is MISSING:
+            token = uuid.uuid4().hex
+            self.backend.set('namespace:' + name, token)
+        return token
+
+    def invalidate_namespace(self, name):
+        self.backend.set('namespace:' + name, uuid.uuid4().hex)
+        self._count(name, 'invalidations')
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        state = self.state
+        with state.lock:
+            keys = {key: dict(counters) for key, counters in state.counters.items()}
+        return {
+            'backend': type(state.backend).__name__,
+            'entries': len(state.backend),
+            'hits': sum(counters['hits'] for counters in keys.values()),
+            'misses': sum(counters['misses'] for counters in keys.values()),
+            'keys': keys,
+        }
+
+
+cache = Cache()
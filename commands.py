@@ -0,0 +1,104 @@
+import os
+import click
+from bulk_import import MODELS, import_file, reject_writer
+from cache import cache
+from export import FORMATS, export_chunks
+from assets import assets
+from query_plans import check_query_plans
+from templating import precompile_templates
+from purge import purge_deleted
+from jobs import jobs
+
+
+def register_commands(app, db):
+
+    @app.cli.command('check-query-plans')
+    @click.option('--threshold', default=10000, show_default=True,
+                  help='Fail when a query sequentially scans a table with more rows than this.')
+    @click.option('--analyze/--no-analyze', default=True, show_default=True,
+                  help='Refresh planner statistics before running EXPLAIN.')
+    def check_query_plans_command(threshold, analyze):
+        """EXPLAIN the main read queries and fail on sequential scans of large tables or unbounded range scans."""
+        if analyze:
+            db.session.execute('ANALYZE "Venue"; ANALYZE "Artist"; ANALYZE "Show"')
+        report = check_query_plans(db.session, threshold,
+                                   app.config['SHOWS_PAGE_SIZE'], app.config['SEARCH_RESULT_LIMIT'],
+                                   app.config['DETAIL_SHOWS_LIMIT'])
+        failed = False
+        for name, plan, failures in report:
+            if failures:
+                failed = True
+                click.echo('FAIL {0}: {1}'.format(name, ', '.join(failures)))
+            else:
+                click.echo('ok   {0}: {1} (cost {2})'.format(name, plan['Node Type'], plan['Total Cost']))
+        if failed:
+            raise SystemExit(1)
+
+    @app.cli.command('import-data')
+    @click.argument('entity', type=click.Choice(sorted(MODELS)))
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+                  help='Input format; guessed from the file extension by default.')
+    @click.option('--batch-size', default=1000, show_default=True, help='Rows per multi-row INSERT.')
+    @click.option('--reject-file', type=click.Path(dir_okay=False), default=None,
+                  help='Where to write rejected rows as JSON lines [default: PATH.rejects.jsonl].')
+    def import_data_command(entity, path, fmt, batch_size, reject_file):
+        """Bulk load venues, artists or shows from a CSV or JSON lines file."""
+        fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        reject_file = reject_file or path + '.rejects.jsonl'
+
+        with open(reject_file, 'w', encoding='utf-8') as rejects:
+            stats = import_file(db.session, entity, path, fmt, batch_size, reject_writer(rejects))
+
+        cache.clear()
+        click.echo('Imported {0} {1} in {2:.2f}s ({3:.0f} rows/sec), rejected {4}.'.format(
+            stats.inserted, entity, stats.seconds, stats.inserted / stats.seconds if stats.seconds else 0,
+            stats.rejected))
+        if stats.rejected:
+            click.echo('Rejected rows written to {0}'.format(reject_file))
+        elif os.path.exists(reject_file):
+            os.remove(reject_file)
+
+    @app.cli.command('export-data')
+    @click.argument('entity', type=click.Choice(sorted(MODELS)))
+    @click.option('--format', 'fmt', type=click.Choice(sorted(FORMATS)), default='ndjson', show_default=True)
+    @click.option('--gzip', is_flag=True, help='Compress the output with gzip.')
+    @click.option('--output', '-o', type=click.File('wb'), default='-', help='Output file [default: stdout].')
+    def export_data_command(entity, fmt, gzip, output):
+        """Stream venues, artists or shows (with venue and artist names) as NDJSON or CSV."""
+        for chunk in export_chunks(entity, fmt, app.config['EXPORT_BATCH_SIZE'], app.config['EXPORT_CHUNK_SIZE'],
+                                   gzip):
+            output.write(chunk)
+
+    @app.cli.command('compile-templates')
+    def compile_templates_command():
+        """Compile every template into the bytecode cache, e.g. during a deploy before workers start."""
+        if not app.jinja_env.bytecode_cache:
+            raise click.UsageError('TEMPLATE_BYTECODE_CACHE_DIR is not set')
+        count, seconds = precompile_templates(app)
+        click.echo('Compiled {0} templates into {1} in {2:.2f}s.'.format(
+            count, app.config['TEMPLATE_BYTECODE_CACHE_DIR'], seconds))
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Fingerprint, minify and precompress static/ into ASSETS_DIR and write its manifest."""
+        manifest = assets.build()
+        click.echo('Built {0} assets into {1}; restart the workers to serve them.'.format(
+            len(manifest), app.config['ASSETS_DIR']))
+
+    @app.cli.command('purge-deleted')
+    @click.option('--batch-size', default=None, type=int,
+                  help='Shows deleted per transaction [default: PURGE_BATCH_SIZE].')
+    def purge_deleted_command(batch_size):
+        """Remove soft-deleted venues and artists and their shows, in batches."""
+        stats = purge_deleted(db.session, batch_size or app.config['PURGE_BATCH_SIZE'],
+                              app.config['PURGE_PAUSE_SECONDS'])
+        click.echo('Purged {0} venues, {1} artists and {2} shows in {3:.2f}s.'.format(*stats))
+
+    @app.cli.command('run-jobs')
+    @click.option('--workers', default=None, type=int, help='Jobs run at once [default: JOB_WORKERS, at least 1].')
+    def run_jobs_command(workers):
+        """Run background jobs in the foreground, e.g. as a dedicated worker next to web workers with JOB_WORKERS=0."""
+        click.echo('Running jobs ({0}) with {1} threads.'.format(
+            ', '.join(sorted(jobs.tasks)), workers or app.config['JOB_WORKERS'] or 1))
+        jobs.start(workers or app.config['JOB_WORKERS'] or 1).join()
@@ -13,5 +13,109 @@ DB_PASSWORD = os.getenv('DB_PASSWORD', 'postgres')
 DB_NAME = os.getenv('DB_NAME', 'postgres')
 DB_PATH = 'postgresql+psycopg2://{}:{}@{}/{}'.format(DB_USER, DB_PASSWORD, DB_HOST, DB_NAME)
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = DB_PATH
+SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', DB_PATH)
+SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Read replicas (comma separated URLs) for GET and HEAD requests; writes and every other request use the primary.
+# After a write the same browser keeps reading from the primary for REPLICA_STICKY_SECONDS, and a replica
+# more than REPLICA_MAX_LAG_SECONDS behind, or unreachable, is skipped until a later check finds it healthy.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+SQLALCHEMY_BINDS = dict(('replica{0}'.format(number), url) for number, url in enumerate(DATABASE_REPLICA_URLS))
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 10))
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', 5))
+
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+
+# Connection pool of the single engine owned by the app; sized per worker process.
+SQLALCHEMY_ENGINE_OPTIONS = {
+    'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+    'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+    'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+    'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes'),
+    'connect_args': {
+        'options': '-c statement_timeout={0}'.format(DB_STATEMENT_TIMEOUT_MS),
+        'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+    },
+}
+
+# Keyset pagination and streamed rendering of the /shows listing
+SHOWS_PAGE_SIZE = int(os.getenv('SHOWS_PAGE_SIZE', 30))
+SHOWS_STREAM_BATCH_SIZE = int(os.getenv('SHOWS_STREAM_BATCH_SIZE', 500))
+TEMPLATE_STREAM_BUFFER = int(os.getenv('TEMPLATE_STREAM_BUFFER', 50))
+
+# Compiled templates are kept in this directory across restarts and shared by the workers (empty disables).
+# TEMPLATE_PRECOMPILE compiles every template while the app is created instead of on first use.
+TEMPLATE_BYTECODE_CACHE_DIR = os.getenv('TEMPLATE_BYTECODE_CACHE_DIR', os.path.join(basedir, '.jinja_cache'))
+TEMPLATE_PRECOMPILE = os.getenv('TEMPLATE_PRECOMPILE', 'false').lower() in ('1', 'true', 'yes')
+
+# Output of `flask build-assets`, the URL prefix it is served under and its Cache-Control max-age
+ASSETS_DIR = os.getenv('ASSETS_DIR', os.path.join(basedir, 'static', 'dist'))
+ASSETS_URL_PATH = os.getenv('ASSETS_URL_PATH', '/assets')
+ASSETS_MAX_AGE = int(os.getenv('ASSETS_MAX_AGE', 365 * 24 * 3600))
+
+# Rendered {% cache %} fragments (entity tiles), kept per process
+FRAGMENT_CACHE = os.getenv('FRAGMENT_CACHE', 'true').lower() in ('1', 'true', 'yes')
+FRAGMENT_CACHE_MAX_ENTRIES = int(os.getenv('FRAGMENT_CACHE_MAX_ENTRIES', 10000))
+FRAGMENT_CACHE_TTL = int(os.getenv('FRAGMENT_CACHE_TTL', 3600))
+
+# Maximum number of ranked matches returned by the venue/artist search
+SEARCH_RESULT_LIMIT = int(os.getenv('SEARCH_RESULT_LIMIT', 50))
+
+# Number of upcoming and past shows listed on venue and artist pages
+DETAIL_SHOWS_LIMIT = int(os.getenv('DETAIL_SHOWS_LIMIT', 12))
+
+# Query result cache. 'memory' is a per-process LRU with TTL; 'redis' is shared by all workers.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://127.0.0.1:6379/0')
+CACHE_DEFAULT_TTL = int(os.getenv('CACHE_DEFAULT_TTL', 300))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 1024))
+VENUE_AREAS_CACHE_TTL = int(os.getenv('VENUE_AREAS_CACHE_TTL', 600))
+FACETS_CACHE_TTL = int(os.getenv('FACETS_CACHE_TTL', 600))
+
+# Streaming exports: rows fetched per server-side cursor round trip and bytes per response chunk
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 2000))
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 64 * 1024))
+
+# /api/v1 page sizes
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', 50))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 500))
+
+# Most shows booked by one /shows/batch or /api/v1/shows/batch request
+BATCH_SHOWS_MAX = int(os.getenv('BATCH_SHOWS_MAX', 200))
+
+# Background jobs (jobs.py): threads per process running jobs (0 leaves them to `flask run-jobs`), how often
+# the queue is polled, how long a running job's lease lasts without renewal, retry backoff (doubling from
+# JOB_RETRY_DELAY up to JOB_RETRY_MAX_DELAY), how long finished jobs are kept and where job files go
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', 2))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 120))
+JOB_RETRY_DELAY = float(os.getenv('JOB_RETRY_DELAY', 10))
+JOB_RETRY_MAX_DELAY = float(os.getenv('JOB_RETRY_MAX_DELAY', 3600))
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', 7))
+# Must be one directory for every web and job process: the same host, or a mount they all share
+JOB_FILES_DIR = os.getenv('JOB_FILES_DIR', os.path.join(basedir, 'job_files'))
+# How often each process checks the Job table for a rebuild-caches or import job finished elsewhere, after
+# which it drops its own caches and rebuilds its typeahead indexes (0 turns the check off)
+CACHE_SYNC_SECONDS = int(os.getenv('CACHE_SYNC_SECONDS', 10))
+
+# Soft-deleted venues and artists: shows removed per transaction, pause between batches and how often a
+# purge-deleted job is queued besides the one each delete queues (0 turns the periodic purge off)
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', 1000))
+PURGE_PAUSE_SECONDS = float(os.getenv('PURGE_PAUSE_SECONDS', 0.05))
+PURGE_INTERVAL_SECONDS = int(os.getenv('PURGE_INTERVAL_SECONDS', 600))
+
+# /api/v1/<venues|artists>/availability limits: ids per request and days per window
+AVAILABILITY_MAX_IDS = int(os.getenv('AVAILABILITY_MAX_IDS', 500))
+AVAILABILITY_MAX_DAYS = int(os.getenv('AVAILABILITY_MAX_DAYS', 366))
+
+# Per-request SQL counting/timing (Server-Timing header) and the slow query log
+SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION', 'true').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 200))
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', 'slow_queries.log')
+
+# In-process autocomplete indexes: names kept per kind, full rebuild interval (0 disables) and default matches
+TYPEAHEAD_MAX_ENTRIES = int(os.getenv('TYPEAHEAD_MAX_ENTRIES', 200000))
+TYPEAHEAD_REFRESH_SECONDS = int(os.getenv('TYPEAHEAD_REFRESH_SECONDS', 300))
+TYPEAHEAD_LIMIT = int(os.getenv('TYPEAHEAD_LIMIT', 10))
@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from queries import ShowRow, VenueRow, ArtistRow, columns, live, shows_listing
+from model import Venue, Artist, Show
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def export_query(entity):
+    if entity == 'venues':
+        return VenueRow._fields, Venue.query.with_entities(*columns(Venue, VenueRow)).filter(live(Venue)) \
+            .order_by(Venue.id)
+    if entity == 'artists':
+        return ArtistRow._fields, Artist.query.with_entities(*columns(Artist, ArtistRow)).filter(live(Artist)) \
+            .order_by(Artist.id)
+    return ShowRow._fields, shows_listing().order_by(None).order_by(Show.id)
+
+
+def stream_rows(query, batch_size):
+    # Server-side cursor: psycopg2 fetches batch_size rows at a time instead of the whole result.
+    return query.execution_options(stream_results=True).yield_per(batch_size)
+
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError('{0!r} is not JSON serializable'.format(value))
+
+
+def ndjson_lines(fieldnames, rows):
+    encode = json.JSONEncoder(default=json_default, separators=(',', ':')).encode
+    for row in rows:
+        yield encode(dict(zip(fieldnames, row))) + '\n'
+
+
+def csv_lines(fieldnames, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fieldnames)
+    for row in rows:
+        writer.writerow([','.join(value) if isinstance(value, list) else
+                         value.isoformat() if isinstance(value, datetime) else value
+                         for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def chunked(lines, chunk_size):
+    # Coalesce lines into chunks of about chunk_size bytes so each write/yield carries real work.
+    parts, size = [], 0
+    for line in lines:
+        parts.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield ''.join(parts).encode('utf-8')
+            parts, size = [], 0
+    if parts:
+        yield ''.join(parts).encode('utf-8')
+
+
+def gzipped(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_chunks(entity, fmt, batch_size, chunk_size, gzip=False):
+    fieldnames, query = export_query(entity)
+    lines = (ndjson_lines if fmt == 'ndjson' else csv_lines)(fieldnames, stream_rows(query, batch_size))
+    chunks = chunked(lines, chunk_size)
+    return gzipped(chunks) if gzip else chunks
@@ -1,3 +1,4 @@
+import os
 from fabric.api import local, settings, abort
 from fabric.contrib.console import confirm
 
@@ -13,6 +14,14 @@ def test():
         abort("Aborted at user request.")
 
 
+def benchmark(url='http://127.0.0.1:5000', baseline='benchmarks/baseline.json'):
+    # The first run on a machine records its baseline; later runs are compared against it.
+    if os.path.exists(baseline):
+        local("python benchmarks/load.py --url {0} --read-only --baseline {1}".format(url, baseline))
+    else:
+        local("python benchmarks/load.py --url {0} --read-only -o {1}".format(url, baseline))
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
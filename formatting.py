@@ -0,0 +1,29 @@
+import functools
+from datetime import datetime
+import babel
+import babel.dates
+import dateutil.parser
+
+DATETIME_FORMATS = {
+    'full': "MM, d, y 'at' h:m",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@functools.lru_cache(maxsize=64)
+def datetime_pattern(format):
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format))
+
+
+@functools.lru_cache(maxsize=16)
+def locale(identifier):
+    return babel.Locale.parse(identifier)
+
+
+def format_datetime(value, format='medium', locale_identifier=babel.dates.LC_TIME):
+    # Views hand over native datetimes; strings are still accepted and parsed once.
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=babel.dates.UTC)
+    return datetime_pattern(format).apply(value, locale(locale_identifier))
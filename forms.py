@@ -1,7 +1,8 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, TextAreaField, IntegerField, \
+    BooleanField
+from wtforms.validators import DataRequired, InputRequired, AnyOf, URL, Optional, NumberRange
 
 class ShowForm(Form):
     artist_id = StringField(
@@ -12,9 +13,38 @@ class ShowForm(Form):
     )
     start_time = DateTimeField(
         'start_time',
-        validators=[DataRequired()],
+        validators=[InputRequired()],
         default= datetime.today()
     )
+    end_time = DateTimeField(
+        'end_time',
+        validators=[Optional()]
+    )
+
+class ShowBatchForm(Form):
+    artist_id = IntegerField(
+        'artist_id', validators=[InputRequired()]
+    )
+    venue_id = IntegerField(
+        'venue_id', validators=[InputRequired()]
+    )
+    # Either one start time per line, or a recurrence rule (RFC 5545 RRULE) starting at start_time.
+    dates = TextAreaField(
+        'dates'
+    )
+    rrule = StringField(
+        'rrule'
+    )
+    start_time = DateTimeField(
+        'start_time',
+        validators=[Optional()]
+    )
+    duration = IntegerField(
+        'duration', validators=[Optional(), NumberRange(min=1, max=24 * 60)]
+    )
+    allow_partial = BooleanField(
+        'allow_partial'
+    )
 
 class VenueForm(Form):
     name = StringField(
@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import re
+import time
+import traceback
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask.signals import before_render_template, template_rendered, signals_available
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_query_logger = logging.getLogger('fyyur.slow_queries')
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+|'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LIST = re.compile(r'\bIN \((?:\?, )*\?\)', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+    # Parameters and literals become '?', so one query shape groups under one log key.
+    statement = WHITESPACE.sub(' ', statement).strip()
+    statement = PLACEHOLDER.sub('?', statement)
+    return IN_LIST.sub('IN (...)', statement)
+
+
+def call_site(depth=3):
+    # The innermost frames of our own code (outside this module): the helper that ran the query and its callers.
+    frames = []
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if frame.filename.startswith('<') or 'site-packages' in filename:
+            continue
+        if filename.startswith(PROJECT_ROOT) and filename != os.path.abspath(__file__):
+            frames.append('{0}:{1} in {2}'.format(os.path.relpath(filename, PROJECT_ROOT), frame.lineno, frame.name))
+            if len(frames) == depth:
+                break
+    return ' < '.join(frames) or None
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        payload = dict(record.msg) if isinstance(record.msg, dict) else {'message': record.getMessage()}
+        payload['time'] = self.formatTime(record)
+        return json.dumps(payload, default=str)
+
+
+class SQLInstrumentation(object):
+    # The engine listeners are shared by every app; the slow query threshold is per app, in
+    # app.extensions['sql_instrumentation'].
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_INSTRUMENTATION', True)
+        app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 200)
+        app.config.setdefault('SLOW_QUERY_LOG', 'slow_queries.log')
+        if not app.config['SQL_INSTRUMENTATION']:
+            return
+        app.extensions['sql_instrumentation'] = app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000.0
+
+        if app.config['SLOW_QUERY_LOG'] and not slow_query_logger.handlers:
+            handler = logging.FileHandler(app.config['SLOW_QUERY_LOG'])
+            handler.setFormatter(JsonFormatter())
+            slow_query_logger.addHandler(handler)
+            slow_query_logger.setLevel(logging.WARNING)
+            slow_query_logger.propagate = False
+
+        if not event.contains(Engine, 'before_cursor_execute', self.before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+            event.listen(Engine, 'handle_error', self.handle_error)
+        if signals_available:
+            before_render_template.connect(self.before_render, app, weak=False)
+            template_rendered.connect(self.after_render, app, weak=False)
+        app.before_request(self.start_request)
+        app.after_request(self.server_timing)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        if has_request_context() and 'sql_count' in g:
+            g.sql_count += 1
+            g.sql_time += elapsed
+        threshold = current_app.extensions.get('sql_instrumentation') if has_app_context() else None
+        if threshold is not None and elapsed >= threshold:
+            slow_query_logger.warning({
+                'duration_ms': round(elapsed * 1000, 3),
+                'sql': normalize_sql(statement),
+                'call_site': call_site(),
+                'endpoint': request.endpoint if has_request_context() else None,
+                'executemany': executemany,
+            })
+
+    def handle_error(self, context):
+        # A failed statement never reaches after_cursor_execute; drop its start time so the connection
+        # (which goes back to the pool) doesn't pair the next query with it.
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+    def before_render(self, sender, template, context, **extra):
+        if has_request_context() and 'template_time' in g:
+            g.template_started = time.perf_counter()
+
+    def after_render(self, sender, template, context, **extra):
+        if has_request_context() and g.get('template_started') is not None:
+            g.template_time += time.perf_counter() - g.template_started
+            g.template_started = None
+
+    def start_request(self):
+        g.request_started = time.perf_counter()
+        g.sql_count = 0
+        g.sql_time = 0.0
+        g.template_time = 0.0
+
+    def server_timing(self, response):
+        if 'request_started' not in g:
+            return response
+        # Streamed responses report only the work done before the first byte.
+        timings = [
+            'db;dur={0:.2f};desc="{1} queries"'.format(g.sql_time * 1000, g.sql_count),
+            'template;dur={0:.2f}'.format(g.template_time * 1000),
+            'total;dur={0:.2f}'.format((time.perf_counter() - g.request_started) * 1000),
+        ]
+        response.headers.add('Server-Timing', ', '.join(timings))
+        return response
+
+
+sql_instrumentation = SQLInstrumentation()
@@ -0,0 +1,312 @@
+"""Background jobs.
+
+A job is a row in the "Job" table, so it survives restarts and can be run by any process. Each process
+that runs jobs (a web worker with JOB_WORKERS > 0, or `flask run-jobs`) has a dispatcher thread that
+claims due jobs with FOR UPDATE SKIP LOCKED and hands them to a thread pool of JOB_WORKERS threads.
+A job that raises is queued again with exponential backoff until it runs out of attempts. A running job
+holds a lease that its process renews; if the process dies, the job is claimed again once the lease
+runs out.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from model import db, Job
+from replicas import mark_write
+
+logger = logging.getLogger('fyyur.jobs')
+
+Task = namedtuple('Task', ['func', 'max_attempts', 'concurrency', 'every'])
+ClaimedJob = namedtuple('ClaimedJob', ['id', 'kind', 'args', 'attempts', 'max_attempts'])
+
+# Due jobs, and running jobs whose lease ran out, of the kinds this process has a free slot for.
+CLAIM_SQL = text('''
+UPDATE "Job" SET status = 'running', attempts = attempts + 1, started_at = now(),
+    locked_until = now() + make_interval(secs => :lease)
+WHERE id = (
+    SELECT id FROM "Job"
+    WHERE kind = ANY(:kinds)
+        AND (status = 'queued' AND run_after <= now() OR status = 'running' AND locked_until < now())
+    ORDER BY run_after, id LIMIT 1 FOR UPDATE SKIP LOCKED
+)
+RETURNING id, kind, args, attempts, max_attempts
+''')
+
+QUEUED_SQL = text('''
+SELECT id FROM "Job" WHERE kind = :kind AND unique_key = :unique_key AND status = 'queued'
+''')
+
+# Only the attempt that claimed a job may finish it: a stale runner whose lease was taken over can't.
+FINISH_SQL = text('''
+UPDATE "Job" SET status = :status, result = CAST(:result AS jsonb), error = :error,
+    finished_at = CASE WHEN :status IN ('succeeded', 'failed') THEN now() END,
+    run_after = now() + make_interval(secs => :delay), locked_until = NULL
+WHERE id = :id AND status = 'running' AND attempts = :attempts
+''')
+
+RENEW_SQL = text('''
+UPDATE "Job" SET locked_until = now() + make_interval(secs => :lease) WHERE id = ANY(:ids) AND status = 'running'
+''')
+
+LAST_SUCCEEDED_SQL = text('''
+SELECT max(finished_at) FROM "Job" WHERE kind = ANY(:kinds) AND status = 'succeeded'
+''')
+
+PRUNE_SQL = text('''
+DELETE FROM "Job" WHERE status IN ('succeeded', 'failed') AND finished_at < now() - make_interval(days => :days)
+RETURNING result ->> 'file'
+''')
+
+
+def job_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'args': job.args,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'created_at': job.created_at.isoformat(),
+        'run_after': job.run_after.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'error': job.error,
+        'result': job.result,
+    }
+
+
+class JobRunner(object):
+    # One app's side of the queue, kept in app.extensions['jobs']: its dispatcher, thread pool and the jobs
+    # it is running. The threads push this app's context, whatever app is current elsewhere.
+
+    def __init__(self, app, tasks):
+        self.app = app
+        self.tasks = tasks
+        self.running = {}
+        self._active = set()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._dispatcher = None
+        self._executor = None
+        self._workers = 0
+        self._scheduled_at = {}
+        self._pruned_at = None
+
+    def enqueue(self, kind, unique=False, **args):
+        """Queue a job and return its id. A unique job is only queued if no job of the same kind with the
+        same args is waiting to run; the waiting job's id is returned instead."""
+        unique_key = json.dumps(args, sort_keys=True) if unique else None
+        statement = insert(Job.__table__).values(kind=kind, args=args, unique_key=unique_key,
+                                                 max_attempts=self.tasks[kind].max_attempts)
+        statement = statement.on_conflict_do_nothing(index_elements=['kind', 'unique_key'],
+                                                     index_where=text("status = 'queued'")).returning(Job.id)
+        with db.get_engine(self.app).begin() as connection:
+            job_id = None
+            while job_id is None:
+                job_id = connection.execute(statement).scalar()
+                if job_id is None:
+                    # The waiting job may be claimed between the two statements; then queue ours after all.
+                    job_id = connection.execute(QUEUED_SQL, kind=kind, unique_key=unique_key).scalar()
+        # The client polls the job next; keep its reads on the primary until the job is visible everywhere.
+        mark_write()
+        self._wake.set()
+        return job_id
+
+    def last_succeeded(self, kinds):
+        # When a job of one of these kinds last finished successfully, in any process; None if none is kept.
+        with db.get_engine(self.app).connect() as connection:
+            return connection.execute(LAST_SUCCEEDED_SQL, kinds=list(kinds)).scalar()
+
+    def start(self, workers=None):
+        with self._lock:
+            if self._dispatcher is None:
+                self._workers = workers or self.app.config['JOB_WORKERS']
+                self._executor = ThreadPoolExecutor(self._workers, thread_name_prefix='job')
+                self._dispatcher = threading.Thread(target=self.dispatch, name='job-dispatcher', daemon=True)
+                self._dispatcher.start()
+        return self._dispatcher
+
+    def dispatch(self):
+        while True:
+            self._wake.wait(self.app.config['JOB_POLL_SECONDS'])
+            self._wake.clear()
+            try:
+                self.schedule()
+                self.renew_leases()
+                while self.claim():
+                    pass
+                self.prune()
+            except Exception:
+                logger.exception('job dispatcher failed')
+
+    def schedule(self):
+        now = time.monotonic()
+        for kind, task in self.tasks.items():
+            interval = self.app.config[task.every] if task.every else 0
+            if interval and now - self._scheduled_at.get(kind, -interval) >= interval:
+                self._scheduled_at[kind] = now
+                self.enqueue(kind, unique=True)
+
+    def free_kinds(self):
+        with self._lock:
+            if sum(self.running.values()) >= self._workers:
+                return []
+            return [kind for kind, task in self.tasks.items() if self.running.get(kind, 0) < task.concurrency]
+
+    def claim(self):
+        kinds = self.free_kinds()
+        if not kinds:
+            return False
+        with db.get_engine(self.app).begin() as connection:
+            row = connection.execute(CLAIM_SQL, lease=self.app.config['JOB_LEASE_SECONDS'], kinds=kinds).first()
+        if row is None:
+            return False
+        job = ClaimedJob._make(row)
+        if job.attempts > job.max_attempts:
+            # Its process died on the last attempt.
+            self.finish(job, 'failed', error='Lease expired on attempt {0}'.format(job.max_attempts))
+            return True
+        with self._lock:
+            self.running[job.kind] = self.running.get(job.kind, 0) + 1
+            self._active.add(job.id)
+        self._executor.submit(self.run, job)
+        return True
+
+    def run(self, job):
+        started = time.perf_counter()
+        try:
+            with self.app.app_context():
+                try:
+                    result = self.tasks[job.kind].func(job, **job.args)
+                finally:
+                    db.session.remove()
+        except Exception as err:
+            logger.exception('job %d (%s) failed on attempt %d', job.id, job.kind, job.attempts)
+            self.retry_or_fail(job, err)
+        else:
+            logger.info('job %d (%s) finished in %.2fs', job.id, job.kind, time.perf_counter() - started)
+            self.finish(job, 'succeeded', result=result)
+        finally:
+            with self._lock:
+                self.running[job.kind] -= 1
+                self._active.discard(job.id)
+            self._wake.set()
+
+    def retry_or_fail(self, job, err):
+        error = '{0}: {1}'.format(type(err).__name__, err)
+        if job.attempts >= job.max_attempts:
+            self.finish(job, 'failed', error=error)
+            return
+        delay = min(self.app.config['JOB_RETRY_DELAY'] * 2 ** (job.attempts - 1),
+                    self.app.config['JOB_RETRY_MAX_DELAY'])
+        # Jitter spreads out retries of jobs that failed together, e.g. while the database restarted.
+        self.finish(job, 'queued', error=error, delay=delay * random.uniform(0.8, 1.2))
+
+    def finish(self, job, status, result=None, error=None, delay=0):
+        with db.get_engine(self.app).begin() as connection:
+            connection.execute(FINISH_SQL, id=job.id, attempts=job.attempts, status=status, error=error,
+                               delay=delay, result=json.dumps(result) if result is not None else None)
+
+    def renew_leases(self):
+        with self._lock:
+            ids = list(self._active)
+        if ids:
+            with db.get_engine(self.app).begin() as connection:
+                connection.execute(RENEW_SQL, ids=ids, lease=self.app.config['JOB_LEASE_SECONDS'])
+
+    def prune(self):
+        # Hourly: finished jobs older than JOB_RETENTION_DAYS go, with the files they produced.
+        if self._pruned_at is not None and time.monotonic() - self._pruned_at < 3600:
+            return
+        self._pruned_at = time.monotonic()
+        with db.get_engine(self.app).begin() as connection:
+            files = [name for name, in connection.execute(PRUNE_SQL, days=self.app.config['JOB_RETENTION_DAYS'])]
+        for name in files:
+            if name:
+                try:
+                    os.remove(self.path(name))
+                except OSError:
+                    pass
+
+    def path(self, name):
+        directory = self.app.config['JOB_FILES_DIR']
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, name)
+
+    def stats(self):
+        with db.get_engine(self.app).connect() as connection:
+            counts = connection.execute('SELECT kind, status, count(*) FROM "Job" GROUP BY kind, status').fetchall()
+        queue = {}
+        for kind, status, count in counts:
+            queue.setdefault(kind, {})[status] = count
+        with self._lock:
+            running = {kind: count for kind, count in self.running.items() if count}
+        return {
+            'workers': self._workers if self._dispatcher is not None else 0,
+            'running_here': running,
+            'jobs': queue,
+        }
+
+
+class Jobs(object):
+    """The job kinds, registered once for every app, and the runner of the current app."""
+
+    def __init__(self):
+        self.tasks = {}
+
+    def init_app(self, app):
+        app.config.setdefault('JOB_WORKERS', 2)
+        app.config.setdefault('JOB_POLL_SECONDS', 2)
+        app.config.setdefault('JOB_LEASE_SECONDS', 120)
+        app.config.setdefault('JOB_RETRY_DELAY', 10)
+        app.config.setdefault('JOB_RETRY_MAX_DELAY', 3600)
+        app.config.setdefault('JOB_RETENTION_DAYS', 7)
+        app.config.setdefault('JOB_FILES_DIR', os.path.join(app.root_path, 'job_files'))
+        runner = JobRunner(app, self.tasks)
+        if app.config['JOB_WORKERS']:
+            # Once per web worker, after any fork: each worker's dispatcher and pool run up to JOB_WORKERS jobs.
+            app.before_first_request(runner.start)
+        app.extensions['jobs'] = runner
+
+    def task(self, kind, max_attempts=3, concurrency=1, every=None):
+        """Register func(job, **args) as the job kind.
+
+        concurrency limits how many jobs of this kind one process runs at once. every names a config
+        setting holding an interval in seconds; the job is then also queued that often (0 turns it off).
+        """
+        def decorator(func):
+            self.tasks[kind] = Task(func, max_attempts, concurrency, every)
+            return func
+        return decorator
+
+    @property
+    def runner(self):
+        return current_app.extensions['jobs']
+
+    def enqueue(self, kind, unique=False, **args):
+        return self.runner.enqueue(kind, unique, **args)
+
+    def get(self, job_id):
+        return Job.query.get(job_id)
+
+    def last_succeeded(self, kinds):
+        return self.runner.last_succeeded(kinds)
+
+    def start(self, workers=None):
+        return self.runner.start(workers)
+
+    def stats(self):
+        return self.runner.stats()
+
+    def path(self, name):
+        return self.runner.path(name)
+
+
+jobs = Jobs()
@@ -0,0 +1,37 @@
+"""deleted_at on Venue and Artist for soft deletes, with partial indexes for the purge
+
+Revision ID: 4f6d8b2e91a3
+Revises: c81f4d2a9e07
+Create Date: 2026-10-17 19:05:44.120387
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f6d8b2e91a3'
+down_revision = 'c81f4d2a9e07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.add_column('Artist', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    # Only deleted rows are indexed, so the indexes stay tiny and the purge finds its work without a scan.
+    op.create_index('ix_venue_deleted_at', 'Venue', ['deleted_at'], unique=False,
+                    postgresql_where=sa.text('deleted_at IS NOT NULL'))
+    op.create_index('ix_artist_deleted_at', 'Artist', ['deleted_at'], unique=False,
+                    postgresql_where=sa.text('deleted_at IS NOT NULL'))
+    # Without statistics on the new column the planner guesses "deleted_at IS NULL" is rare and gives up
+    # the ordered index scans the show listing relies on.
+    op.execute('ANALYZE "Venue"')
+    op.execute('ANALYZE "Artist"')
+
+
+def downgrade():
+    op.drop_index('ix_artist_deleted_at', table_name='Artist')
+    op.drop_index('ix_venue_deleted_at', table_name='Venue')
+    op.drop_column('Artist', 'deleted_at')
+    op.drop_column('Venue', 'deleted_at')
@@ -0,0 +1,51 @@
+"""Job table for the background job runner
+
+Revision ID: 9b2c5e7a1d04
+Revises: 4f6d8b2e91a3
+Create Date: 2026-10-17 20:12:31.557208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9b2c5e7a1d04'
+down_revision = '4f6d8b2e91a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'Job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=64), nullable=False),
+        sa.Column('args', postgresql.JSONB(astext_type=sa.Text()), server_default='{}', nullable=False),
+        sa.Column('unique_key', sa.String(), nullable=True),
+        sa.Column('status', sa.String(length=16), server_default='queued', nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('run_after', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('result', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.CheckConstraint("status IN ('queued', 'running', 'succeeded', 'failed')", name='ck_job_status'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_job_due', 'Job', ['run_after'], unique=False,
+                    postgresql_where=sa.text("status IN ('queued', 'running')"))
+    op.create_index('ix_job_unique_key', 'Job', ['kind', 'unique_key'], unique=True,
+                    postgresql_where=sa.text("status = 'queued'"))
+    op.create_index('ix_job_finished_at', 'Job', ['finished_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_job_finished_at', table_name='Job')
+    op.drop_index('ix_job_unique_key', table_name='Job')
+    op.drop_index('ix_job_due', table_name='Job')
+    op.drop_table('Job')
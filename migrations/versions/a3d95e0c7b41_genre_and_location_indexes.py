@@ -0,0 +1,30 @@
+"""GIN indexes on genres and (state, city) indexes for listing filters and facets
+
+Revision ID: a3d95e0c7b41
+Revises: 6fcc7bc2c840
+Create Date: 2026-10-17 14:21:07.418262
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d95e0c7b41'
+down_revision = '6fcc7bc2c840'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_venue_genres', 'Venue', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_artist_genres', 'Artist', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_venue_state_city', 'Venue', ['state', 'city'], unique=False)
+    op.create_index('ix_artist_state_city', 'Artist', ['state', 'city'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_artist_state_city', table_name='Artist')
+    op.drop_index('ix_venue_state_city', table_name='Venue')
+    op.drop_index('ix_artist_genres', table_name='Artist')
+    op.drop_index('ix_venue_genres', table_name='Venue')
@@ -0,0 +1,52 @@
+"""Show end_time and exclusion constraints against overlapping venue and artist bookings
+
+Revision ID: c81f4d2a9e07
+Revises: a3d95e0c7b41
+Create Date: 2026-10-17 15:40:12.902614
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f4d2a9e07'
+down_revision = 'a3d95e0c7b41'
+branch_labels = None
+depends_on = None
+
+OVERLAPS = '''
+SELECT COUNT(*) FROM (
+    SELECT start_time, MAX(end_time) OVER (
+        PARTITION BY {0} ORDER BY start_time, id ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+    ) AS booked_until FROM "Show"
+) AS bookings WHERE booked_until > start_time
+'''
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    # Existing shows get the default two hour slot.
+    op.execute('''UPDATE "Show" SET end_time = start_time + interval '2 hours' ''')
+    op.alter_column('Show', 'end_time', nullable=False)
+    op.create_check_constraint('ck_show_end_after_start', 'Show', 'end_time > start_time')
+
+    connection = op.get_bind()
+    for column in ('venue_id', 'artist_id'):
+        overlapping = connection.execute(OVERLAPS.format(column)).scalar()
+        if overlapping:
+            raise RuntimeError('{0} shows overlap an earlier show with the same {1}; reschedule or remove them '
+                               'before upgrading'.format(overlapping, column))
+
+    op.execute('ALTER TABLE "Show" ADD CONSTRAINT ex_show_venue_overlap '
+               'EXCLUDE USING gist (venue_id WITH =, tsrange(start_time, end_time) WITH &&)')
+    op.execute('ALTER TABLE "Show" ADD CONSTRAINT ex_show_artist_overlap '
+               'EXCLUDE USING gist (artist_id WITH =, tsrange(start_time, end_time) WITH &&)')
+
+
+def downgrade():
+    op.drop_constraint('ex_show_artist_overlap', 'Show')
+    op.drop_constraint('ex_show_venue_overlap', 'Show')
+    op.drop_constraint('ck_show_end_after_start', 'Show', type_='check')
+    op.drop_column('Show', 'end_time')
@@ -0,0 +1,27 @@
+"""version on Venue and Artist for optimistic concurrency on edits
+
+Revision ID: d3a7f1c8e562
+Revises: 9b2c5e7a1d04
+Create Date: 2026-10-17 21:03:18.440913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a7f1c8e562'
+down_revision = '9b2c5e7a1d04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A constant default: Postgres records it in the catalog instead of rewriting the tables.
+    op.add_column('Venue', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('Artist', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('Artist', 'version')
+    op.drop_column('Venue', 'version')
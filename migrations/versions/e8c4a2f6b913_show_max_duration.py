@@ -0,0 +1,28 @@
+"""Check constraint capping a show at one day, which bounds the availability range scans
+
+Revision ID: e8c4a2f6b913
+Revises: d3a7f1c8e562
+Create Date: 2026-10-17 22:41:07.318254
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c4a2f6b913'
+down_revision = 'd3a7f1c8e562'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    connection = op.get_bind()
+    longer = connection.execute('''SELECT COUNT(*) FROM "Show" WHERE end_time > start_time + interval '1 day' ''') \
+        .scalar()
+    if longer:
+        raise RuntimeError('{0} shows last longer than a day; shorten or split them before upgrading'.format(longer))
+    op.create_check_constraint('ck_show_max_duration', 'Show', "end_time <= start_time + interval '1 day'")
+
+
+def downgrade():
+    op.drop_constraint('ck_show_max_duration', 'Show', type_='check')
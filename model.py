@@ -1,8 +1,26 @@
-from flask_sqlalchemy import SQLAlchemy
-db = SQLAlchemy()
+from datetime import timedelta
+from sqlalchemy.dialects.postgresql import ExcludeConstraint, JSONB
+from replicas import RoutingSQLAlchemy
+db = RoutingSQLAlchemy()
+
+# Length of a show booked without an explicit end time.
+DEFAULT_SHOW_DURATION = timedelta(hours=2)
+# Longest show that can be booked; window queries rely on it to bound their start_time range scans.
+MAX_SHOW_DURATION = timedelta(days=1)
+
+
+def default_end_time(context):
+    return context.get_current_parameters()['start_time'] + DEFAULT_SHOW_DURATION
+
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_venue_state_city', 'state', 'city'),
+        db.Index('ix_venue_deleted_at', 'deleted_at', postgresql_where=db.text('deleted_at IS NOT NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -16,11 +34,21 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(500))
     image_link = db.Column(db.String(500))
+    # Set by the delete handlers; purge.py removes the row and its shows later, in batches.
+    deleted_at = db.Column(db.DateTime)
+    # Bumped by every edit; a PATCH names the version it edited and fails with 409 if the row moved on.
+    version = db.Column(db.Integer, nullable=False, server_default='1')
     shows = db.relationship('Show', backref='venue', lazy=True)
 
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_artist_state_city', 'state', 'city'),
+        db.Index('ix_artist_deleted_at', 'deleted_at', postgresql_where=db.text('deleted_at IS NOT NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -33,14 +61,59 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(500))
     image_link = db.Column(db.String(500))
+    # Set by the delete handlers; purge.py removes the row and its shows later, in batches.
+    deleted_at = db.Column(db.DateTime)
+    # Bumped by every edit; a PATCH names the version it edited and fails with 409 if the row moved on.
+    version = db.Column(db.Integer, nullable=False, server_default='1')
     shows = db.relationship('Show', backref='artist', lazy=True)
 
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_show_start_time_id', 'start_time', 'id'),
+        db.CheckConstraint('end_time > start_time', name='ck_show_end_after_start'),
+        db.CheckConstraint("end_time <= start_time + interval '1 day'", name='ck_show_max_duration'),
+        # A venue or an artist can't be booked twice at once; enforced by GiST indexes (btree_gist extension).
+        ExcludeConstraint(('venue_id', '='), (db.func.tsrange(db.column('start_time'), db.column('end_time')), '&&'),
+                          using='gist', name='ex_show_venue_overlap'),
+        ExcludeConstraint(('artist_id', '='), (db.func.tsrange(db.column('start_time'), db.column('end_time')), '&&'),
+                          using='gist', name='ex_show_artist_overlap'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False, default=default_end_time)
 
+
+class Job(db.Model):
+    # Background work run by jobs.py: queued -> running -> succeeded, or back to queued until it fails for good.
+    __tablename__ = 'Job'
+    __table_args__ = (
+        db.Index('ix_job_due', 'run_after', postgresql_where=db.text("status IN ('queued', 'running')")),
+        # At most one queued job per kind and unique_key; jobs without a unique_key never conflict.
+        db.Index('ix_job_unique_key', 'kind', 'unique_key', unique=True,
+                 postgresql_where=db.text("status = 'queued'")),
+        db.Index('ix_job_finished_at', 'finished_at'),
+        db.CheckConstraint("status IN ('queued', 'running', 'succeeded', 'failed')", name='ck_job_status'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    args = db.Column(JSONB, nullable=False, server_default='{}')
+    unique_key = db.Column(db.String)
+    status = db.Column(db.String(16), nullable=False, server_default='queued')
+    attempts = db.Column(db.Integer, nullable=False, server_default='0')
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_after = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+    # A running job whose lease runs out (its process died) is claimed again by another process.
+    locked_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    error = db.Column(db.Text)
+    result = db.Column(JSONB)
@@ -0,0 +1,27 @@
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(*values):
+    payload = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values],
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, *parsers):
+    # Opaque keyset cursors: the last row's sort key, one parser per column.
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (TypeError, ValueError) as err:
+        raise ValueError('Invalid cursor: {0}'.format(err))
+    if not isinstance(values, list) or len(values) != len(parsers):
+        raise ValueError('Invalid cursor: expected {0} values'.format(len(parsers)))
+    try:
+        return tuple(parse(value) for parse, value in zip(parsers, values))
+    except (TypeError, ValueError) as err:
+        # Well-formed JSON can still hold the wrong types, e.g. [1, null] for a (datetime, id) key.
+        raise ValueError('Invalid cursor: {0}'.format(err))
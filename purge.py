@@ -0,0 +1,45 @@
+import time
+from collections import namedtuple
+from sqlalchemy import and_, exists, select, text
+from model import Venue, Artist, Show
+
+PurgeStats = namedtuple('PurgeStats', ['venues', 'artists', 'shows', 'seconds'])
+
+# SKIP LOCKED lets several purgers (or a purger and a request touching the same shows) run side by side.
+DELETE_SHOWS = '''
+DELETE FROM "Show" WHERE id IN (
+    SELECT id FROM "Show" WHERE {0} = ANY(:ids) LIMIT :batch_size FOR UPDATE SKIP LOCKED
+)
+'''
+
+
+def purge_deleted(session, batch_size, pause=0.0):
+    """Remove soft-deleted venues and artists with their shows.
+
+    Every batch of at most batch_size rows is its own short transaction, with an optional pause between
+    batches, so a venue with a long history never holds locks on "Show" for long.
+    """
+    started = time.perf_counter()
+    removed = {'venues': 0, 'artists': 0, 'shows': 0}
+    for model, column, key in ((Venue, Show.venue_id, 'venues'), (Artist, Show.artist_id, 'artists')):
+        while True:
+            ids = [row_id for row_id, in session.execute(
+                select([model.id]).where(model.deleted_at.isnot(None)).order_by(model.deleted_at).limit(batch_size))]
+            if not ids:
+                break
+            while True:
+                deleted = session.execute(text(DELETE_SHOWS.format(column.name)),
+                                          {'ids': ids, 'batch_size': batch_size}).rowcount
+                session.commit()
+                removed['shows'] += deleted
+                if not deleted:
+                    break
+                time.sleep(pause)
+            purged = session.execute(model.__table__.delete().where(and_(
+                model.id.in_(ids), model.deleted_at.isnot(None), ~exists().where(column == model.id)))).rowcount
+            session.commit()
+            removed[key] += purged
+            if not purged:
+                # Their shows are locked by another purger, which will finish them.
+                break
+    return PurgeStats(removed['venues'], removed['artists'], removed['shows'], time.perf_counter() - started)
@@ -0,0 +1,224 @@
+from collections import namedtuple
+from sqlalchemy import tuple_, func, select, and_, cast, exists, true, false, literal, literal_column, union_all, String
+from sqlalchemy.dialects import postgresql
+from model import db, Venue, Artist, Show
+
+# Read-side rows: plain tuples selected column by column, never tracked by the session's identity map.
+NameRow = namedtuple('NameRow', ['id', 'name'])
+SearchRow = namedtuple('SearchRow', ['id', 'name', 'total'])
+AreaRow = namedtuple('AreaRow', ['city', 'state', 'venues'])
+ShowRow = namedtuple('ShowRow', ['id', 'start_time', 'venue_id', 'venue_name', 'artist_id', 'artist_name',
+                                 'artist_image_link'])
+VenueRow = namedtuple('VenueRow', ['id', 'name', 'genres', 'address', 'city', 'state', 'phone', 'website',
+                                   'facebook_link', 'seeking_talent', 'seeking_description', 'image_link'])
+ArtistRow = namedtuple('ArtistRow', ['id', 'name', 'genres', 'city', 'state', 'phone', 'website', 'facebook_link',
+                                     'seeking_venue', 'seeking_description', 'image_link'])
+VenueEditRow = namedtuple('VenueEditRow', VenueRow._fields + ('version',))
+ArtistEditRow = namedtuple('ArtistEditRow', ArtistRow._fields + ('version',))
+VenueDetailRow = namedtuple('VenueDetailRow', VenueRow._fields + ('upcoming_shows_count', 'past_shows_count'))
+ArtistDetailRow = namedtuple('ArtistDetailRow', ArtistRow._fields + ('upcoming_shows_count', 'past_shows_count'))
+ShowCardRow = namedtuple('ShowCardRow', ['venue_id', 'artist_id', 'start_time', 'name', 'image_link', 'upcoming'])
+FacetRow = namedtuple('FacetRow', ['value', 'count'])
+CityFacetRow = namedtuple('CityFacetRow', ['city', 'state', 'count'])
+
+# Listing and search filters: every genre must be present (genres @> ...), city and state match exactly.
+Filters = namedtuple('Filters', ['genres', 'city', 'state'])
+NO_FILTERS = Filters((), None, None)
+
+
+def columns(model, row_type):
+    return [getattr(model, field) for field in row_type._fields]
+
+
+def fetch_all(row_type, query):
+    return [row_type._make(row) for row in query]
+
+
+def fetch_one(row_type, query):
+    row = query.first()
+    return row_type._make(row) if row is not None else None
+
+
+def live(model):
+    # Soft-deleted venues and artists, and their shows, are hidden from every read until purge.py removes them.
+    if model is Show:
+        # Correlated to Show only, so the subqueries keep their own FROM when Venue and Artist are joined too.
+        return and_(~exists().where(and_(Venue.id == Show.venue_id, Venue.deleted_at.isnot(None))).correlate(Show),
+                    ~exists().where(and_(Artist.id == Show.artist_id, Artist.deleted_at.isnot(None))).correlate(Show))
+    return model.deleted_at.is_(None)
+
+
+def filter_conditions(model, filters):
+    conditions = [live(model)]
+    if filters.genres:
+        # Served by the GIN index on genres; the cast keeps both sides of @> character varying[].
+        conditions.append(model.genres.op('@>')(cast(literal(list(filters.genres)), postgresql.ARRAY(String))))
+    if filters.city:
+        conditions.append(model.city == filters.city)
+    if filters.state:
+        conditions.append(model.state == filters.state)
+    return conditions
+
+
+def venue_areas_query(filters=NO_FILTERS):
+    # Keys are inline literals: a bound key has no type for a server-side prepared statement (asgi.py) to infer.
+    return Venue.query.with_entities(
+        Venue.city,
+        Venue.state,
+        postgresql.array_agg(func.json_build_object(literal_column("'id'"), Venue.id,
+                                                    literal_column("'name'"), Venue.name)).label('venues')) \
+        .filter(*filter_conditions(Venue, filters)) \
+        .group_by(Venue.city, Venue.state)
+
+
+def venue_areas(filters=NO_FILTERS):
+    return fetch_all(AreaRow, venue_areas_query(filters))
+
+
+def artist_names_query(filters=NO_FILTERS):
+    return Artist.query.with_entities(Artist.id, Artist.name) \
+        .filter(*filter_conditions(Artist, filters)) \
+        .order_by(Artist.id)
+
+
+def artist_names(filters=NO_FILTERS):
+    return fetch_all(NameRow, artist_names_query(filters))
+
+
+def venue_names():
+    return fetch_all(NameRow, Venue.query.with_entities(Venue.id, Venue.name).filter(live(Venue)).order_by(Venue.id))
+
+
+def facet_queries(model, filters):
+    conditions = filter_conditions(model, filters)
+    genres = model.query.with_entities(func.unnest(model.genres).label('value')).filter(*conditions).subquery()
+    count = func.count().label('count')
+    return {
+        'genres': db.session.query(genres.c.value, count).group_by(genres.c.value)
+        .order_by(count.desc(), genres.c.value),
+        'states': model.query.with_entities(model.state, count).filter(*conditions).group_by(model.state)
+        .order_by(count.desc(), model.state),
+        'cities': model.query.with_entities(model.city, model.state, count).filter(*conditions)
+        .group_by(model.city, model.state).order_by(count.desc(), model.state, model.city),
+    }
+
+
+def facet_counts(model, filters=NO_FILTERS):
+    queries = facet_queries(model, filters)
+    return {
+        'genres': [FacetRow._make(row)._asdict() for row in queries['genres']],
+        'states': [FacetRow._make(row)._asdict() for row in queries['states']],
+        'cities': [CityFacetRow._make(row)._asdict() for row in queries['cities']],
+    }
+
+
+def venue_edit_row(venue_id):
+    return fetch_one(VenueEditRow, Venue.query.with_entities(*columns(Venue, VenueEditRow))
+                     .filter(Venue.id == venue_id, live(Venue)))
+
+
+def artist_edit_row(artist_id):
+    return fetch_one(ArtistEditRow, Artist.query.with_entities(*columns(Artist, ArtistEditRow))
+                     .filter(Artist.id == artist_id, live(Artist)))
+
+
+def venue_detail_query(venue_id, now):
+    return Venue.query.with_entities(*columns(Venue, VenueRow) +
+                                     show_counts(Show.venue_id, venue_id, Artist, Show.artist_id, now)) \
+        .filter(Venue.id == venue_id, live(Venue))
+
+
+def artist_detail_query(artist_id, now):
+    return Artist.query.with_entities(*columns(Artist, ArtistRow) +
+                                      show_counts(Show.artist_id, artist_id, Venue, Show.venue_id, now)) \
+        .filter(Artist.id == artist_id, live(Artist))
+
+
+def venue_detail(venue_id, now):
+    return fetch_one(VenueDetailRow, venue_detail_query(venue_id, now))
+
+
+def artist_detail(artist_id, now):
+    return fetch_one(ArtistDetailRow, artist_detail_query(artist_id, now))
+
+
+def shows_listing(after=None):
+    query = Show.query.join(Venue, Show.venue_id == Venue.id) \
+        .join(Artist, Show.artist_id == Artist.id) \
+        .with_entities(Show.id,
+                       Show.start_time,
+                       Show.venue_id,
+                       Venue.name.label('venue_name'),
+                       Show.artist_id,
+                       Artist.name.label('artist_name'),
+                       Artist.image_link.label('artist_image_link')) \
+        .filter(live(Venue), live(Artist)) \
+        .order_by(Show.start_time, Show.id)
+    if after:
+        query = query.filter(tuple_(Show.start_time, Show.id) > after)
+    return query
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_by_name_query(model, search_term, limit, filters=NO_FILTERS):
+    # ILIKE '%term%' is served by the gin_trgm_ops index on name; rank by trigram similarity.
+    return model.query.with_entities(model.id,
+                                     model.name,
+                                     func.count().over().label('total')) \
+        .filter(model.name.ilike('%{0}%'.format(escape_like(search_term))), *filter_conditions(model, filters)) \
+        .order_by(func.similarity(model.name, search_term).desc(), model.name, model.id) \
+        .limit(limit)
+
+
+def search_by_name(model, search_term, limit, filters=NO_FILTERS):
+    return fetch_all(SearchRow, search_by_name_query(model, search_term, limit, filters))
+
+
+def show_counts(entity_column, entity_id, counterpart, counterpart_column, now):
+    # Scalar subqueries answered from the (venue_id|artist_id, start_time) indexes. Shows of a deleted counterpart
+    # are left out, as they are from the lists beside the counts, by an anti-join against the partial deleted_at
+    # index rather than a join that would look up the counterpart of every show.
+    deleted = exists().where(and_(counterpart.id == counterpart_column, counterpart.deleted_at.isnot(None))) \
+        .correlate(Show)
+
+    def count(condition):
+        return select([func.count()]).select_from(Show.__table__).where(and_(entity_column == entity_id, condition,
+                                                                             ~deleted))
+
+    return [
+        count(Show.start_time > now).label('upcoming_shows_count'),
+        count(Show.start_time <= now).label('past_shows_count'),
+    ]
+
+
+def upcoming_and_past_statement(entity_column, entity_id, counterpart, counterpart_column, now, limit):
+    # Each branch is an index range scan with its own LIMIT, so the cost is bounded by limit, not history.
+    def bounded(condition, order, upcoming):
+        return select([Show.venue_id,
+                       Show.artist_id,
+                       Show.start_time,
+                       counterpart.name.label('name'),
+                       counterpart.image_link.label('image_link'),
+                       (true() if upcoming else false()).label('upcoming')]) \
+            .select_from(Show.__table__.join(counterpart.__table__, counterpart.id == counterpart_column)) \
+            .where(and_(entity_column == entity_id, condition, live(counterpart))) \
+            .order_by(order) \
+            .limit(limit) \
+            .alias()
+
+    upcoming = bounded(Show.start_time > now, Show.start_time.asc(), True)
+    past = bounded(Show.start_time <= now, Show.start_time.desc(), False)
+    return union_all(select([upcoming]), select([past]))
+
+
+def split_upcoming_and_past(rows):
+    return sorted((row for row in rows if row.upcoming), key=lambda row: row.start_time), \
+        sorted((row for row in rows if not row.upcoming), key=lambda row: row.start_time, reverse=True)
+
+
+def upcoming_and_past_shows(entity_column, entity_id, counterpart, counterpart_column, now, limit):
+    return split_upcoming_and_past(fetch_all(ShowCardRow, db.session.execute(upcoming_and_past_statement(
+        entity_column, entity_id, counterpart, counterpart_column, now, limit))))
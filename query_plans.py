@@ -0,0 +1,95 @@
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql
+from model import Venue, Artist, Show
+from queries import Filters, shows_listing, search_by_name_query, venue_detail_query, artist_detail_query, \
+    upcoming_and_past_statement, venue_areas_query, artist_names_query
+from scheduling import booked_shows_query
+from api import RESOURCES, projection
+
+
+def api_shows_query(fields, page_size):
+    return projection(RESOURCES['shows'], fields)[1].order_by(Show.start_time, Show.id).limit(page_size + 1)
+
+
+def main_queries(page_size, search_limit, detail_limit):
+    # The queries behind /shows, the detail pages and search, bound to ids that exist in the database.
+    venue_id = Venue.query.with_entities(func.min(Venue.id)).scalar() or 0
+    artist_id = Artist.query.with_entities(func.min(Artist.id)).scalar() or 0
+    middle = Show.query.with_entities(Show.start_time, Show.id) \
+        .order_by(Show.start_time, Show.id) \
+        .offset(Show.query.count() // 2).limit(1).first()
+    after = tuple(middle) if middle else None
+    now = datetime.now()
+
+    return [
+        ('shows: first page', shows_listing().limit(page_size + 1)),
+        ('shows: cursor page', shows_listing(after).limit(page_size + 1)),
+        ('api shows: default fields', api_shows_query(list(RESOURCES['shows'].columns), page_size)),
+        ('api shows: without names', api_shows_query(['id', 'start_time'], page_size)),
+        ('venue detail: counts', venue_detail_query(venue_id, now)),
+        ('venue detail: shows', upcoming_and_past_statement(Show.venue_id, venue_id, Artist, Show.artist_id,
+                                                            now, detail_limit)),
+        ('artist detail: counts', artist_detail_query(artist_id, now)),
+        ('artist detail: shows', upcoming_and_past_statement(Show.artist_id, artist_id, Venue, Show.venue_id,
+                                                             now, detail_limit)),
+        ('venue search', search_by_name_query(Venue, 'music', search_limit)),
+        ('artist search', search_by_name_query(Artist, 'band', search_limit)),
+        ('venues by genre', venue_areas_query(Filters(('Jazz',), None, None))),
+        ('venues by state', venue_areas_query(Filters((), None, 'NY'))),
+        ('artists by genre', artist_names_query(Filters(('Jazz',), None, None))),
+        ('venue availability', booked_shows_query(Show.venue_id, list(range(venue_id, venue_id + 200)),
+                                                  now, now + timedelta(days=366))),
+        ('artist availability', booked_shows_query(Show.artist_id, list(range(artist_id, artist_id + 200)),
+                                                   now, now + timedelta(days=366))),
+    ]
+
+
+# Window queries must scan a bounded start_time range per id, not each id's whole history before the window ends.
+RANGE_QUERIES = {'venue availability', 'artist availability'}
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        for descendant in plan_nodes(child):
+            yield descendant
+
+
+def explain(session, query):
+    compiled = getattr(query, 'statement', query).compile(dialect=postgresql.dialect())
+    connection = session.connection()
+    result = connection.execute('EXPLAIN (FORMAT JSON) ' + compiled.string, compiled.params).scalar()
+    plan = result if isinstance(result, list) else json.loads(result)
+    return plan[0]['Plan']
+
+
+def table_sizes(session):
+    rows = session.connection().execute(
+        "SELECT relname, reltuples FROM pg_class WHERE relkind = 'r' AND relname IN ('Venue', 'Artist', 'Show')"
+    ).fetchall()
+    return {name: tuples for name, tuples in rows}
+
+
+def unbounded_range(node):
+    condition = node.get('Index Cond') or ''
+    return 'start_time' in node.get('Index Name', '') and not ('start_time >' in condition and
+                                                               'start_time <' in condition)
+
+
+def check_query_plans(session, threshold, page_size, search_limit, detail_limit):
+    # Returns (name, plan, failures) for every query; a failure is a Seq Scan over a table above threshold rows,
+    # or a start_time index scan of a RANGE_QUERIES entry that is not bounded on both sides.
+    sizes = table_sizes(session)
+    report = []
+    for name, query in main_queries(page_size, search_limit, detail_limit):
+        plan = explain(session, query)
+        failures = ['Seq Scan on {0} (~{1:.0f} rows)'.format(node['Relation Name'], sizes.get(node['Relation Name']))
+                    for node in plan_nodes(plan)
+                    if node['Node Type'] == 'Seq Scan' and sizes.get(node['Relation Name'], 0) > threshold]
+        if name in RANGE_QUERIES:
+            failures += ['{0} on {1} without both start_time bounds'.format(node['Node Type'], node['Index Name'])
+                         for node in plan_nodes(plan) if unbounded_range(node)]
+        report.append((name, plan, failures))
+    return report
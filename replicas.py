@@ -0,0 +1,188 @@
+"""Read replica routing.
+
+Every engine in SQLALCHEMY_BINDS whose key starts with 'replica' is a read replica of the primary.
+GET and HEAD requests read from a healthy replica; everything else, and every flush, goes to the
+primary. A request that wrote sets a short-lived cookie, and while it lasts the same browser reads
+from the primary so it sees its own changes. A background thread measures each replica's lag and
+takes it out of rotation when it falls behind or stops answering.
+"""
+import logging
+import random
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql.dml import UpdateBase
+from db_pool import pool_stats
+
+logger = logging.getLogger('fyyur.replicas')
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Seconds of replay lag; 0 when the replica has applied everything it has received, or isn't a standby.
+LAG_SQL = '''
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+'''
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        if isinstance(clause, UpdateBase):
+            # INSERT/UPDATE/DELETE statements executed through the session rather than flushed from objects.
+            mark_write()
+        elif not self._flushing and has_request_context():
+            key = g.get('db_replica')
+            if key is not None:
+                return get_state(self.app).db.get_engine(self.app, bind=key)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def mark_write(*args):
+    if has_request_context():
+        g.db_wrote = True
+
+
+event.listen(RoutingSession, 'after_flush', mark_write)
+event.listen(RoutingSession, 'after_bulk_update', mark_write)
+event.listen(RoutingSession, 'after_bulk_delete', mark_write)
+
+
+class Replica(object):
+
+    def __init__(self, key, engine):
+        self.key = key
+        self.engine = engine
+        self.healthy = False
+        self.lag = None
+        self.error = None
+        self.checked_at = None
+
+    def snapshot(self):
+        return {
+            'healthy': self.healthy,
+            'lag_seconds': self.lag,
+            'error': self.error,
+            'checked_seconds_ago': time.monotonic() - self.checked_at if self.checked_at is not None else None,
+            'pool': pool_stats(self.engine),
+        }
+
+
+class ReplicaSet(object):
+    # One app's replicas and the thread checking their lag, kept in app.extensions['replicas'].
+
+    def __init__(self, app, db):
+        self.app = app
+        self.replicas = {}
+        self._monitor = None
+        for key in sorted(app.config.get('SQLALCHEMY_BINDS') or {}):
+            if key.startswith('replica'):
+                self.replicas[key] = Replica(key, db.get_engine(app, bind=key))
+                event.listen(self.replicas[key].engine, 'handle_error', self._failed(self.replicas[key]))
+
+    def start_monitor(self):
+        if self._monitor is None:
+            self._monitor = threading.Thread(target=self.monitor, name='replica-monitor', daemon=True)
+            self._monitor.start()
+
+    def monitor(self):
+        while True:
+            for replica in list(self.replicas.values()):
+                self.check(replica)
+            time.sleep(self.app.config['REPLICA_CHECK_INTERVAL'])
+
+    def check(self, replica):
+        try:
+            with replica.engine.connect() as connection:
+                lag = float(connection.execute(LAG_SQL).scalar())
+        except Exception as err:
+            if replica.healthy:
+                logger.warning('replica %s is down: %s', replica.key, err)
+            replica.healthy, replica.lag, replica.error = False, None, str(err).strip()
+        else:
+            healthy = lag <= self.app.config['REPLICA_MAX_LAG_SECONDS']
+            if healthy != replica.healthy:
+                logger.warning('replica %s is %s (lag %.1fs)', replica.key, 'back' if healthy else 'lagging', lag)
+            replica.healthy, replica.lag, replica.error = healthy, lag, None
+        replica.checked_at = time.monotonic()
+
+    def _failed(self, replica):
+        def handle_error(context):
+            # A lost or refused connection takes the replica out of rotation right away rather than at the
+            # next check; errors raised by the query itself say nothing about the replica's health.
+            if context.is_disconnect or context.connection is None:
+                replica.healthy, replica.error = False, str(context.original_exception).strip()
+                logger.warning('replica %s failed: %s', replica.key, replica.error)
+        return handle_error
+
+    def choose(self):
+        healthy = [replica.key for replica in self.replicas.values() if replica.healthy]
+        return random.choice(healthy) if healthy else None
+
+
+class ReplicaRouter(object):
+    """Routes the requests of every app it was initialized with to that app's replicas."""
+
+    def init_app(self, app, db):
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 5)
+        app.config.setdefault('REPLICA_STICKY_COOKIE', 'fyyur_primary_until')
+        app.config.setdefault('REPLICA_MAX_LAG_SECONDS', 10)
+        app.config.setdefault('REPLICA_CHECK_INTERVAL', 5)
+        replicas = ReplicaSet(app, db)
+        if replicas.replicas:
+            # Each worker process measures lag for the replicas it routes to; a thread started before a
+            # preloading server forks would not exist in the workers.
+            app.before_first_request(replicas.start_monitor)
+            app.before_request(self.route_request)
+            app.after_request(self.remember_write)
+            app.register_error_handler(DBAPIError, self.retry_on_primary)
+        app.extensions['replicas'] = replicas
+
+    @property
+    def replicas(self):
+        return current_app.extensions['replicas'].replicas
+
+    def sticky(self):
+        try:
+            until = float(request.cookies.get(current_app.config['REPLICA_STICKY_COOKIE'], 0))
+        except ValueError:
+            return False
+        now = time.time()
+        return now < until <= now + current_app.config['REPLICA_STICKY_SECONDS']
+
+    def route_request(self):
+        g.db_replica = current_app.extensions['replicas'].choose() \
+            if request.method in READ_METHODS and not self.sticky() else None
+
+    def remember_write(self, response):
+        if g.get('db_wrote'):
+            window = current_app.config['REPLICA_STICKY_SECONDS']
+            response.set_cookie(current_app.config['REPLICA_STICKY_COOKIE'], '{0:.3f}'.format(time.time() + window),
+                                max_age=window, httponly=True, samesite='Lax')
+        return response
+
+    def retry_on_primary(self, err):
+        # A read whose replica went away while it ran is repeated once against the primary.
+        key = g.get('db_replica')
+        if key is None or self.replicas[key].healthy:
+            raise err
+        get_state(current_app).db.session.rollback()
+        g.db_replica = None
+        return current_app.dispatch_request()
+
+    def stats(self):
+        return {key: replica.snapshot() for key, replica in self.replicas.items()}
+
+
+replica_router = ReplicaRouter()
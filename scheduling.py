@@ -0,0 +1,230 @@
+from collections import namedtuple
+from datetime import timedelta
+from itertools import islice
+import dateutil.parser
+import dateutil.rrule
+from sqlalchemy import func, text, bindparam, DateTime
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import IntegrityError
+from model import db, Venue, Artist, Show, MAX_SHOW_DURATION
+from queries import live
+
+EXCLUSION_VIOLATION = '23P01'
+CHECK_VIOLATION = '23514'
+FOREIGN_KEY_VIOLATION = '23503'
+
+# Exclusion constraint -> (form field, Show column, label)
+OVERLAP_CONSTRAINTS = {
+    'ex_show_venue_overlap': ('venue_id', Show.venue_id, 'Venue'),
+    'ex_show_artist_overlap': ('artist_id', Show.artist_id, 'Artist'),
+}
+
+
+def booked_range():
+    return func.tsrange(Show.start_time, Show.end_time)
+
+
+def overlapping_show(column, entity_id, start_time, end_time):
+    # Same && operator as the exclusion constraint, so the lookup is answered by its GiST index.
+    return Show.query.with_entities(Show.id, Show.start_time, Show.end_time) \
+        .filter(column == entity_id, booked_range().op('&&')(func.tsrange(start_time, end_time))) \
+        .order_by(Show.start_time) \
+        .first()
+
+
+def booking_errors(err, venue_id, artist_id, start_time, end_time):
+    """Turn an IntegrityError from inserting a show into (status, {form field: message}), or None."""
+    orig = getattr(err, 'orig', None)
+    code = getattr(orig, 'pgcode', None)
+    diag = getattr(orig, 'diag', None)
+    constraint = getattr(diag, 'constraint_name', None) or ''
+
+    if code == EXCLUSION_VIOLATION and constraint in OVERLAP_CONSTRAINTS:
+        field, column, label = OVERLAP_CONSTRAINTS[constraint]
+        entity_id = venue_id if field == 'venue_id' else artist_id
+        existing = overlapping_show(column, entity_id, start_time, end_time)
+        if existing is None:
+            # The conflicting show was removed in the meantime; the booking may be retried.
+            return 409, {field: '{0} #{1} was booked at the same time; please try again'.format(label, entity_id)}
+        return 409, {field: '{0} #{1} is already booked from {2:%Y-%m-%d %H:%M} to {3:%Y-%m-%d %H:%M} (show #{4})'
+                     .format(label, entity_id, existing.start_time, existing.end_time, existing.id)}
+    if code == CHECK_VIOLATION and constraint == 'ck_show_end_after_start':
+        return 400, {'end_time': 'End time must be after the start time'}
+    if code == CHECK_VIOLATION and constraint == 'ck_show_max_duration':
+        return 400, {'end_time': 'A show can last at most {0} hours'.format(MAX_SHOW_DURATION // timedelta(hours=1))}
+    if code == FOREIGN_KEY_VIOLATION:
+        if 'venue_id' in constraint:
+            return 400, {'venue_id': 'Venue #{0} does not exist'.format(venue_id)}
+        if 'artist_id' in constraint:
+            return 400, {'artist_id': 'Artist #{0} does not exist'.format(artist_id)}
+    return None
+
+
+def missing_entities(venue_id, artist_id):
+    """{form field: message} for a venue or artist id that doesn't exist or is soft-deleted.
+
+    The foreign keys alone would accept a soft-deleted row. Ids may come straight from a form, so anything
+    but digits counts as missing.
+    """
+    errors = {}
+    for field, model, entity_id in (('venue_id', Venue, venue_id), ('artist_id', Artist, artist_id)):
+        if not str(entity_id).isdigit() or \
+                model.query.with_entities(model.id).filter(model.id == int(entity_id), live(model)).first() is None:
+            errors[field] = '{0} #{1} does not exist'.format(model.__name__, entity_id)
+    return errors
+
+
+def booked_shows_query(column, entity_ids, start, end):
+    # One query for every entity. No show lasts longer than MAX_SHOW_DURATION, so a show overlapping the window
+    # starts less than that before it: each id is a bounded range scan of the (venue_id|artist_id, start_time) index.
+    return Show.query.with_entities(column, Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time) \
+        .filter(column.in_(entity_ids),
+                Show.start_time > start - MAX_SHOW_DURATION,
+                Show.start_time < end,
+                Show.end_time > start) \
+        .order_by(column, Show.start_time)
+
+
+def free_slots(busy, start, end, min_free):
+    # The gaps of [start, end) not covered by busy (sorted by start_time) that last at least min_free.
+    slots = []
+    cursor = start
+    for show in busy:
+        if show['start_time'] - cursor >= min_free and show['start_time'] > cursor:
+            slots.append({'start_time': cursor, 'end_time': show['start_time']})
+        cursor = max(cursor, show['end_time'])
+    if end - cursor >= min_free and end > cursor:
+        slots.append({'start_time': cursor, 'end_time': end})
+    return slots
+
+
+def availability(column, entity_ids, start, end, min_free):
+    busy = dict((entity_id, []) for entity_id in entity_ids)
+    for entity_id, show_id, venue_id, artist_id, start_time, end_time in booked_shows_query(
+            column, entity_ids, start, end):
+        busy[entity_id].append({
+            'show_id': show_id,
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'start_time': start_time,
+            'end_time': end_time,
+        })
+    return [{'id': entity_id, 'busy': shows, 'free': free_slots(shows, start, end, min_free)}
+            for entity_id, shows in busy.items()]
+
+
+# Every slot of a batch against the venue's and the artist's existing shows in one statement; each
+# side of the OR is answered by the GiST index of its exclusion constraint.
+BATCH_CONFLICTS = text('''
+SELECT slot.n, show.id, show.venue_id, show.artist_id, show.start_time, show.end_time
+FROM unnest(:starts, :ends) WITH ORDINALITY AS slot (start_time, end_time, n)
+JOIN "Show" AS show
+  ON (show.venue_id = :venue_id OR show.artist_id = :artist_id)
+ AND tsrange(show.start_time, show.end_time) && tsrange(slot.start_time, slot.end_time)
+ORDER BY slot.n, show.start_time
+''').bindparams(bindparam('starts', type_=ARRAY(DateTime)), bindparam('ends', type_=ARRAY(DateTime)))
+
+BatchResult = namedtuple('BatchResult', ['created', 'failures'])
+
+
+class BatchError(ValueError):
+
+    def __init__(self, errors, status=400):
+        super(BatchError, self).__init__('; '.join(errors.values()))
+        self.errors = errors
+        self.status = status
+
+
+def batch_start_times(dates, rule, dtstart, limit):
+    """The start times of a batch: a list of dates (strings or datetimes), or an RRULE expanded from dtstart."""
+    if bool(dates) == bool(rule):
+        raise BatchError({'dates': 'Give either a list of dates or a recurrence rule'})
+    if rule:
+        if dtstart is None:
+            raise BatchError({'start_time': 'A recurrence rule needs a start time'})
+        try:
+            # Rules without COUNT or UNTIL are endless; one past the limit is enough to reject them.
+            starts = list(islice(dateutil.rrule.rrulestr(rule, dtstart=dtstart), limit + 1))
+        except (ValueError, TypeError) as err:
+            raise BatchError({'rrule': 'Invalid recurrence rule: {0}'.format(err)})
+    else:
+        starts = []
+        for value in dates:
+            try:
+                starts.append(value if hasattr(value, 'hour') else dateutil.parser.parse(value))
+            except (ValueError, OverflowError, TypeError):
+                # TypeError: a JSON number, list or null where a date string belongs.
+                raise BatchError({'dates': 'Not a valid date and time: {0!r}'.format(value)})
+    if not starts:
+        raise BatchError({'dates': 'The batch has no dates'})
+    if any(start.tzinfo is not None for start in starts):
+        # Show times are stored without a time zone, so an offset can't be compared with existing shows.
+        raise BatchError({'start_time' if rule else 'dates': 'Start times must be local times without a UTC offset'})
+    if len(starts) > limit:
+        raise BatchError({'rrule' if rule else 'dates': 'At most {0} shows can be booked at once'.format(limit)})
+    return starts
+
+
+def batch_failures(venue_id, artist_id, slots):
+    # {slot index: reason} for slots that overlap an existing show or an accepted slot earlier in the batch.
+    failures = {}
+    conflicts = db.session.execute(BATCH_CONFLICTS, {
+        'starts': [start_time for start_time, _ in slots],
+        'ends': [end_time for _, end_time in slots],
+        'venue_id': venue_id,
+        'artist_id': artist_id,
+    })
+    for n, show_id, show_venue_id, show_artist_id, start_time, end_time in conflicts:
+        label, entity_id = ('Venue', venue_id) if show_venue_id == venue_id else ('Artist', artist_id)
+        failures.setdefault(n - 1, '{0} #{1} is already booked from {2:%Y-%m-%d %H:%M} to {3:%Y-%m-%d %H:%M} '
+                                   '(show #{4})'.format(label, entity_id, start_time, end_time, show_id))
+
+    # Only accepted slots block the ones after them: a rejected slot is never booked.
+    order = sorted((index for index in range(len(slots)) if index not in failures), key=lambda index: slots[index])
+    booked_until = None
+    for index in order:
+        start_time, end_time = slots[index]
+        if booked_until is not None and start_time < booked_until[0]:
+            failures[index] = 'Overlaps {0:%Y-%m-%d %H:%M} earlier in this batch'.format(slots[booked_until[1]][0])
+        else:
+            booked_until = (end_time, index)
+    return failures
+
+
+def book_shows(venue_id, artist_id, starts, duration, allow_partial=False):
+    """Book one show per start time in a single transaction.
+
+    Without allow_partial a single failing slot rejects the whole batch and nothing is created; with it
+    the free slots are booked and the others are reported. Returns a BatchResult of created
+    {id, start_time, end_time} and failed {index, start_time, end_time, error} entries; a missing venue or
+    artist raises BatchError.
+    """
+    errors = missing_entities(venue_id, artist_id)
+    if errors:
+        raise BatchError(errors)
+
+    slots = [(start_time, start_time + duration) for start_time in starts]
+    failures = batch_failures(venue_id, artist_id, slots)
+    failed = [{'index': index, 'start_time': slots[index][0], 'end_time': slots[index][1], 'error': failures[index]}
+              for index in sorted(failures)]
+    if failed and not allow_partial:
+        db.session.rollback()
+        return BatchResult([], failed)
+
+    rows = [{'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start_time, 'end_time': end_time}
+            for index, (start_time, end_time) in enumerate(slots) if index not in failures]
+    if not rows:
+        db.session.rollback()
+        return BatchResult([], failed)
+    try:
+        created = db.session.execute(Show.__table__.insert().values(rows)
+                                     .returning(Show.id, Show.start_time, Show.end_time)).fetchall()
+        db.session.commit()
+    except IntegrityError as err:
+        db.session.rollback()
+        if getattr(err.orig, 'pgcode', None) != EXCLUSION_VIOLATION:
+            raise
+        # A show booked between the check and the insert; the whole statement was rolled back.
+        raise BatchError({'dates': 'Another booking for this venue or artist was made at the same time; '
+                                   'please try again'}, 409)
+    return BatchResult([dict(row) for row in sorted(created, key=lambda row: row.start_time)], failed)
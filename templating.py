@@ -0,0 +1,123 @@
+import os
+import tempfile
+import threading
+import time
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from cache import MemoryBackend, MISSING
+
+
+class AtomicBytecodeCache(FileSystemBytecodeCache):
+    # Several workers share the directory; write to a temporary file and rename it into place so that
+    # none of them ever loads a half-written module.
+
+    def dump_bytecode(self, bucket):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                bucket.write_bytecode(f)
+            os.replace(tmp_path, self._get_cache_filename(bucket))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache 'show-tile', show.id, show %}...{% endcache %}
+
+    Caches the rendered block under the template, the tag's position and the given key parts, usually
+    an entity id followed by a version of whatever the block displays. Any change to the version
+    renders a new fragment, so nothing needs to be invalidated explicitly.
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        key = nodes.Tuple([nodes.Const(parser.name), nodes.Const(lineno)] + parts, 'load')
+        return nodes.CallBlock(self.call_method('_cached', [key]), [], [], body).set_lineno(lineno)
+
+    def _cached(self, key, caller):
+        fragments = getattr(self.environment, 'fragment_cache', None)
+        if fragments is None:
+            return caller()
+        return fragments.get_or_render(key, caller)
+
+
+class FragmentStore(object):
+    # Per process on purpose: a tile renders in microseconds, far less than a round trip to a shared cache.
+
+    def __init__(self, max_entries, ttl):
+        self.backend = MemoryBackend(max_entries)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        try:
+            fragment = self.backend.get(key)
+        except TypeError:
+            # Unhashable key parts (dicts, lists) can't be cached; render as usual.
+            return render()
+        with self._lock:
+            if fragment is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if fragment is MISSING:
+            fragment = render()
+            self.backend.set(key, fragment, self.ttl)
+        return fragment
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {'entries': len(self.backend), 'hits': self.hits, 'misses': self.misses}
+
+
+class FragmentCache(object):
+    """The rendered fragments of the current app, kept in app.extensions['fragment_cache']."""
+
+    def init_app(self, app):
+        app.config.setdefault('FRAGMENT_CACHE', True)
+        app.config.setdefault('FRAGMENT_CACHE_MAX_ENTRIES', 10000)
+        app.config.setdefault('FRAGMENT_CACHE_TTL', 3600)
+        store = FragmentStore(app.config['FRAGMENT_CACHE_MAX_ENTRIES'], app.config['FRAGMENT_CACHE_TTL'])
+        app.extensions['fragment_cache'] = store
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = store if app.config['FRAGMENT_CACHE'] else None
+
+    def clear(self):
+        current_app.extensions['fragment_cache'].clear()
+
+    def stats(self):
+        return current_app.extensions['fragment_cache'].stats()
+
+
+fragment_cache = FragmentCache()
+
+
+def init_templates(app):
+    app.config.setdefault('TEMPLATE_BYTECODE_CACHE_DIR', None)
+    app.config.setdefault('TEMPLATE_PRECOMPILE', False)
+    if app.config['TEMPLATE_BYTECODE_CACHE_DIR']:
+        os.makedirs(app.config['TEMPLATE_BYTECODE_CACHE_DIR'], exist_ok=True)
+        app.jinja_env.bytecode_cache = AtomicBytecodeCache(app.config['TEMPLATE_BYTECODE_CACHE_DIR'])
+    fragment_cache.init_app(app)
+
+
+def precompile_templates(app):
+    # Loads every template into the environment's in-memory cache (and the bytecode cache when one is
+    # configured), so the first request to each page doesn't pay for parsing and compiling it.
+    started = time.perf_counter()
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names), time.perf_counter() - started
@@ -0,0 +1,213 @@
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+import unicodedata
+from flask import current_app
+
+logger = logging.getLogger('fyyur.typeahead')
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    # Case and accent insensitive: 'Café' and 'cafe' index and match the same way.
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def tokenize(name, max_tokens):
+    return TOKEN.findall(normalize(name))[:max_tokens]
+
+
+class PrefixIndex(object):
+    # Names by id plus one sorted list of (token, id); a prefix lookup is a bisect into that list.
+
+    def __init__(self, max_entries, max_tokens=8):
+        self.max_entries = max_entries
+        self.max_tokens = max_tokens
+        self.names = {}
+        self.folded = {}
+        self.keys = []
+        self.dropped = 0
+
+    @classmethod
+    def build(cls, rows, max_entries, max_tokens=8):
+        index = cls(max_entries, max_tokens)
+        for entity_id, name in rows:
+            if not name:
+                continue
+            if len(index.names) >= max_entries:
+                index.dropped += 1
+                continue
+            index.names[entity_id] = name
+            index.folded[entity_id] = ' '.join(tokenize(name, max_tokens))
+            index.keys.extend((token, entity_id) for token in set(index.folded[entity_id].split()))
+        index.keys.sort()
+        return index
+
+    def add(self, entity_id, name):
+        self.remove(entity_id)
+        if not name:
+            return
+        if len(self.names) >= self.max_entries:
+            self.dropped += 1
+            return
+        self.names[entity_id] = name
+        self.folded[entity_id] = ' '.join(tokenize(name, self.max_tokens))
+        for token in set(self.folded[entity_id].split()):
+            bisect.insort(self.keys, (token, entity_id))
+
+    def remove(self, entity_id):
+        if self.names.pop(entity_id, None) is None:
+            return
+        for token in set(self.folded.pop(entity_id).split()):
+            position = bisect.bisect_left(self.keys, (token, entity_id))
+            if position < len(self.keys) and self.keys[position] == (token, entity_id):
+                del self.keys[position]
+
+    def search(self, query, limit, scan_limit=2000):
+        # Every query word must be the prefix of a word in the name; names starting with the query rank first.
+        terms = tokenize(query, self.max_tokens)
+        if not terms:
+            return []
+        lead = max(terms, key=len)
+        others = list(terms)
+        others.remove(lead)
+
+        phrase = ' '.join(terms)
+        matches, seen = [], set()
+        position = bisect.bisect_left(self.keys, (lead,))
+        end = min(len(self.keys), position + scan_limit)
+        while position < end and self.keys[position][0].startswith(lead):
+            entity_id = self.keys[position][1]
+            position += 1
+            if entity_id in seen:
+                continue
+            seen.add(entity_id)
+            folded = self.folded[entity_id]
+            if others:
+                name_tokens = folded.split()
+                if not all(any(token.startswith(term) for token in name_tokens) for term in others):
+                    continue
+            matches.append((not folded.startswith(phrase), folded, entity_id))
+
+        return [(entity_id, self.names[entity_id]) for _, _, entity_id in heapq.nsmallest(limit, matches)]
+
+    def __len__(self):
+        return len(self.names)
+
+
+class TypeaheadIndexes(object):
+    # One app's indexes, kept in app.extensions['typeahead'].
+
+    def __init__(self, app, sources):
+        self.app = app
+        self.sources = sources
+        self.indexes = {}
+        self.built_at = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def build(self):
+        # sources: kind -> callable returning (id, name) rows; needs an app context.
+        started = time.perf_counter()
+        indexes = {}
+        for kind, source in self.sources.items():
+            indexes[kind] = PrefixIndex.build(source(), self.app.config['TYPEAHEAD_MAX_ENTRIES'])
+        with self._lock:
+            self.indexes = indexes
+            self.built_at = time.monotonic()
+        logger.info('typeahead indexes built in %.3fs: %s', time.perf_counter() - started,
+                    ', '.join('{0}={1}'.format(kind, len(index)) for kind, index in indexes.items()))
+
+    def refresh(self):
+        # Rebuild in the background; searches keep using the current indexes until the new ones are swapped in.
+        if self._refreshing:
+            return
+        self._refreshing = True
+        threading.Thread(target=self._refresh, name='typeahead-refresh', daemon=True).start()
+
+    def _refresh(self):
+        try:
+            with self.app.app_context():
+                self.build()
+        except Exception:
+            logger.exception('typeahead refresh failed')
+        finally:
+            self._refreshing = False
+
+    def _refresh_if_stale(self):
+        refresh_seconds = self.app.config['TYPEAHEAD_REFRESH_SECONDS']
+        if not refresh_seconds or self.built_at is None:
+            return
+        if time.monotonic() - self.built_at >= refresh_seconds:
+            self.refresh()
+
+    def search(self, kind, query, limit):
+        self._refresh_if_stale()
+        with self._lock:
+            index = self.indexes.get(kind)
+            return index.search(query, limit) if index is not None else []
+
+    def add(self, kind, entity_id, name):
+        with self._lock:
+            if kind in self.indexes:
+                self.indexes[kind].add(entity_id, name)
+
+    def remove(self, kind, entity_id):
+        with self._lock:
+            if kind in self.indexes:
+                self.indexes[kind].remove(entity_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'built_seconds_ago': time.monotonic() - self.built_at if self.built_at is not None else None,
+                'indexes': {kind: {'names': len(index), 'keys': len(index.keys), 'dropped': index.dropped}
+                            for kind, index in self.indexes.items()},
+            }
+
+
+class Typeahead(object):
+    """Per-process name indexes for autocomplete, loaded on the first request.
+
+    The write handlers update the index of the process that served them; other worker processes pick
+    the change up when their index is rebuilt every TYPEAHEAD_REFRESH_SECONDS. Each app has its own
+    indexes; the methods here act on those of the current app.
+    """
+
+    def init_app(self, app, sources):
+        app.config.setdefault('TYPEAHEAD_MAX_ENTRIES', 200000)
+        app.config.setdefault('TYPEAHEAD_REFRESH_SECONDS', 300)
+        app.config.setdefault('TYPEAHEAD_LIMIT', 10)
+        indexes = TypeaheadIndexes(app, sources)
+        app.before_first_request(indexes.build)
+        app.extensions['typeahead'] = indexes
+
+    @property
+    def indexes(self):
+        return current_app.extensions['typeahead']
+
+    def build(self):
+        self.indexes.build()
+
+    def refresh(self):
+        self.indexes.refresh()
+
+    def search(self, kind, query, limit):
+        return self.indexes.search(kind, query, limit)
+
+    def add(self, kind, entity_id, name):
+        self.indexes.add(kind, entity_id, name)
+
+    def remove(self, kind, entity_id):
+        self.indexes.remove(kind, entity_id)
+
+    def stats(self):
+        return self.indexes.stats()
+
+
+typeahead = Typeahead()
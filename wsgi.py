@@ -0,0 +1,10 @@
+"""WSGI entry point:
+
+    $ gunicorn wsgi:app
+
+app.py only defines create_app(), so importing it never builds an app; this module builds the one a server
+runs. `flask` commands find create_app() in app.py themselves.
+"""
+from app import create_app
+
+app = create_app()